@@ -4,16 +4,32 @@ E-commerce Sales Data Analytics MCP Server
 Provides intelligent querying capabilities for sales data analysis
 """
 
+from __future__ import annotations
+
+import time
+
+_MODULE_IMPORT_STARTED = time.perf_counter()
+
+import argparse
 import asyncio
+import importlib
 import json
-import pandas as pd
-import numpy as np
+import math
+import os
+import re
+import sys
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 import sqlite3
 from pathlib import Path
 import logging
 
+try:
+    import fcntl
+except ImportError:  # Windows: the single-tailer lock is skipped
+    fcntl = None
+
 # MCP Server imports
 from mcp.server import Server
 from mcp.server.models import InitializationOptions
@@ -30,12 +46,764 @@ from mcp.types import (
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class LazyModule:
+    """Defer importing a heavy module until one of its attributes is first used"""
+
+    def __init__(self, module_name: str):
+        self._module_name = module_name
+        self._module = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if self._module is None:
+            started = time.perf_counter()
+            self._module = importlib.import_module(self._module_name)
+            logger.info(f"Imported {self._module_name} in {time.perf_counter() - started:.3f}s")
+        return getattr(self._module, attr)
+
+
+# pandas and NumPy are only needed once data is loaded or queried
+LAZY_MODULES = ("pandas", "numpy")
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+
+# Startup regression budget checked by --profile-startup
+STARTUP_BUDGET_SECONDS = 2.0
+
+# Rule-based insight engine settings
+INSIGHT_TIME_BUDGET_SECONDS = 0.05
+INSIGHT_MAX_ROWS = 100_000
+INSIGHT_CHUNK_ROWS = 10_000
+INSIGHT_MIN_ROWS = 4
+INSIGHT_TOP_K = 3
+INSIGHT_MAX_NAMES = 3
+CONCENTRATION_SHARE_THRESHOLD = 0.5
+# Modified z-score (median/MAD) cut-off; unlike a mean/std z-score it is not
+# capped at sqrt(n - 1), so it can fire on short ranked results
+ANOMALY_Z_THRESHOLD = 3.5
+OUTLIER_IQR_MULTIPLIER = 1.5
+TREND_BREAK_PERCENT = 25.0
+
+# Label column, metric column and entity name used by the insight engine for
+# each analysis type. Ordered analyses are checked for trend breaks.
+INSIGHT_RULES = {
+    "top_products": {"label": "product_name", "metric": "total_revenue", "entity": "products", "ordered": False},
+    "category_performance": {"label": "category", "metric": "total_revenue", "entity": "categories", "ordered": False},
+    "inventory_status": {"label": "product_name", "metric": "stock_quantity", "entity": "products", "ordered": False},
+    "profit_analysis": {"label": "product_name", "metric": "total_profit", "entity": "products", "ordered": False},
+    "top_customers": {"label": "customer_id", "metric": "total_spent", "entity": "customers", "ordered": False},
+    "geographic_distribution": {"label": "shipping_state", "metric": "total_revenue", "entity": "states", "ordered": False},
+    "purchase_patterns": {"label": "customer_type", "metric": "avg_customer_value", "entity": "customer types", "ordered": False},
+    "customer_lifetime_value": {"label": "customer_segment", "metric": "avg_lifetime_value", "entity": "segments", "ordered": False},
+    "monthly_trends": {"label": "month", "metric": "revenue", "entity": "months", "ordered": True},
+    "daily_patterns": {"label": "day_of_week", "metric": "revenue", "entity": "days", "ordered": False},
+    "seasonal_analysis": {"label": "season", "metric": "revenue", "entity": "seasons", "ordered": False},
+    "growth_rate": {"label": "month", "metric": "revenue", "entity": "months", "ordered": True},
+}
+
+DATE_FILTERS = {
+    "all": "",
+    "last_30_days": "AND order_date >= date('now', '-30 days')",
+    "this_month": "AND strftime('%Y-%m', order_date) = strftime('%Y-%m', 'now')",
+    "this_year": "AND strftime('%Y', order_date) = strftime('%Y', 'now')",
+}
+
+SCHEMA_SQL = """
+CREATE TABLE orders (
+    order_id TEXT PRIMARY KEY,
+    customer_id TEXT,
+    order_date TIMESTAMP,
+    total_amount REAL,
+    status TEXT,
+    shipping_state TEXT,
+    payment_method TEXT
+);
+CREATE TABLE products (
+    product_id TEXT PRIMARY KEY,
+    product_name TEXT,
+    category TEXT,
+    price REAL,
+    cost REAL,
+    stock_quantity INTEGER,
+    profit_margin REAL
+);
+CREATE TABLE order_items (
+    order_item_id INTEGER PRIMARY KEY,
+    order_id TEXT,
+    product_id TEXT,
+    quantity INTEGER,
+    unit_price REAL,
+    total_price REAL
+);
+CREATE TABLE customers (
+    customer_id TEXT PRIMARY KEY,
+    customer_name TEXT,
+    email TEXT,
+    registration_date TIMESTAMP,
+    customer_segment TEXT
+);
+"""
+
+TABLE_NAMES = ("orders", "products", "order_items", "customers")
+
+INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_orders_status_date ON orders (status, order_date);
+CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders (customer_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items (product_id);
+"""
+
+# Per-product and per-customer totals over completed orders, rebuilt on load.
+# The descending indexes keep every ranked metric sorted, overall and per
+# category or segment, so top-N queries read the first rows of an index.
+ROLLUP_SQL = """
+DROP TABLE IF EXISTS product_sales;
+CREATE TABLE product_sales (
+    product_id TEXT PRIMARY KEY,
+    product_name TEXT,
+    category TEXT,
+    price REAL,
+    cost REAL,
+    profit_margin REAL,
+    units_sold INTEGER,
+    total_revenue REAL,
+    total_cost REAL,
+    total_profit REAL,
+    price_sum REAL,
+    item_count INTEGER
+);
+INSERT INTO product_sales
+SELECT 
+    p.product_id,
+    p.product_name,
+    p.category,
+    p.price,
+    p.cost,
+    p.profit_margin,
+    COALESCE(sales.units_sold, 0),
+    COALESCE(sales.total_revenue, 0),
+    COALESCE(sales.units_sold, 0) * p.cost,
+    COALESCE(sales.total_revenue, 0) - COALESCE(sales.units_sold, 0) * p.cost,
+    COALESCE(sales.price_sum, 0),
+    COALESCE(sales.item_count, 0)
+FROM products p
+LEFT JOIN (
+    SELECT 
+        oi.product_id,
+        SUM(oi.quantity) as units_sold,
+        SUM(oi.total_price) as total_revenue,
+        SUM(oi.unit_price) as price_sum,
+        COUNT(*) as item_count
+    FROM order_items oi
+    JOIN orders o ON oi.order_id = o.order_id
+    WHERE o.status = 'completed'
+    GROUP BY oi.product_id
+) sales ON p.product_id = sales.product_id;
+CREATE INDEX idx_product_sales_revenue ON product_sales (total_revenue DESC);
+CREATE INDEX idx_product_sales_units ON product_sales (units_sold DESC);
+CREATE INDEX idx_product_sales_profit ON product_sales (total_profit DESC);
+CREATE INDEX idx_product_sales_category_revenue ON product_sales (category, total_revenue DESC);
+CREATE INDEX idx_product_sales_category_profit ON product_sales (category, total_profit DESC);
+
+DROP TABLE IF EXISTS customer_sales;
+CREATE TABLE customer_sales (
+    customer_id TEXT PRIMARY KEY,
+    customer_segment TEXT,
+    total_orders INTEGER,
+    total_spent REAL,
+    last_order_date TIMESTAMP
+);
+INSERT INTO customer_sales
+SELECT 
+    o.customer_id,
+    c.customer_segment,
+    COUNT(o.order_id),
+    SUM(o.total_amount),
+    MAX(o.order_date)
+FROM orders o
+LEFT JOIN customers c ON o.customer_id = c.customer_id
+WHERE o.status = 'completed'
+GROUP BY o.customer_id;
+CREATE INDEX idx_customer_sales_spent ON customer_sales (total_spent DESC);
+CREATE INDEX idx_customer_sales_segment_spent ON customer_sales (customer_segment, total_spent DESC);
+
+DROP TABLE IF EXISTS state_status_sales;
+CREATE TABLE state_status_sales (
+    shipping_state TEXT,
+    status TEXT,
+    orders INTEGER,
+    revenue REAL,
+    PRIMARY KEY (shipping_state, status)
+);
+INSERT INTO state_status_sales
+SELECT COALESCE(shipping_state, 'Unknown'), status, COUNT(*), SUM(total_amount)
+FROM orders
+GROUP BY COALESCE(shipping_state, 'Unknown'), status;
+"""
+
+ROLLUP_TABLES = ("product_sales", "customer_sales", "state_status_sales")
+
+# Ingestion bookkeeping that survives rollup rebuilds. Feed offsets are keyed
+# "feed_offset:<feed path>" and written in the same transaction as the batch.
+# Per-table change counters are keyed "version:<table>" and bumped by every
+# batch and rebuild, so any process reading the database can tell when its
+# cached results went stale.
+INGEST_STATE_SQL = """
+CREATE TABLE IF NOT EXISTS ingest_state (
+    key TEXT PRIMARY KEY,
+    value INTEGER
+);
+"""
+
+# Stored in PRAGMA user_version; bump when ROLLUP_SQL or INGEST_STATE_SQL
+# changes so existing databases rebuild their rollups on load
+ROLLUP_VERSION = 3
+
+# Incremental versions of ROLLUP_SQL, applied to the orders and order items
+# staged in the batch_orders / batch_order_items temp tables
+INCREMENTAL_ROLLUP_STATEMENTS = (
+"""
+INSERT INTO customer_sales (customer_id, customer_segment, total_orders, total_spent, last_order_date)
+SELECT o.customer_id, c.customer_segment, COUNT(*), SUM(o.total_amount), MAX(o.order_date)
+FROM orders o
+JOIN batch_orders b ON o.order_id = b.order_id
+LEFT JOIN customers c ON o.customer_id = c.customer_id
+WHERE o.status = 'completed'
+GROUP BY o.customer_id
+ON CONFLICT (customer_id) DO UPDATE SET
+    customer_segment = COALESCE(excluded.customer_segment, customer_segment),
+    total_orders = total_orders + excluded.total_orders,
+    total_spent = total_spent + excluded.total_spent,
+    last_order_date = MAX(COALESCE(last_order_date, excluded.last_order_date), COALESCE(excluded.last_order_date, last_order_date))
+""",
+"""
+INSERT INTO state_status_sales (shipping_state, status, orders, revenue)
+SELECT COALESCE(o.shipping_state, 'Unknown'), o.status, COUNT(*), SUM(o.total_amount)
+FROM orders o
+JOIN batch_orders b ON o.order_id = b.order_id
+WHERE 1 = 1
+GROUP BY COALESCE(o.shipping_state, 'Unknown'), o.status
+ON CONFLICT (shipping_state, status) DO UPDATE SET
+    orders = orders + excluded.orders,
+    revenue = revenue + excluded.revenue
+""",
+"""
+INSERT INTO product_sales (
+    product_id, product_name, category, price, cost, profit_margin,
+    units_sold, total_revenue, total_cost, total_profit, price_sum, item_count
+)
+SELECT 
+    p.product_id, p.product_name, p.category, p.price, p.cost, p.profit_margin,
+    SUM(oi.quantity), SUM(oi.total_price), SUM(oi.quantity) * p.cost,
+    SUM(oi.total_price) - SUM(oi.quantity) * p.cost, SUM(oi.unit_price), COUNT(*)
+FROM order_items oi
+JOIN batch_order_items b ON oi.order_item_id = b.order_item_id
+JOIN products p ON oi.product_id = p.product_id
+JOIN orders o ON oi.order_id = o.order_id
+WHERE o.status = 'completed'
+GROUP BY p.product_id
+ON CONFLICT (product_id) DO UPDATE SET
+    units_sold = units_sold + excluded.units_sold,
+    total_revenue = total_revenue + excluded.total_revenue,
+    total_cost = total_cost + excluded.total_cost,
+    total_profit = total_profit + excluded.total_profit,
+    price_sum = price_sum + excluded.price_sum,
+    item_count = item_count + excluded.item_count
+""",
+)
+
+# Change feed: JSON lines with a "type" of customer, order or order_item,
+# applied in micro-batches. FEED_PATH makes the MCP server tail it in-process.
+FEED_PATH = os.environ.get("FEED_PATH")
+FEED_RECORD_TYPES = {"customer": "customers", "order": "orders", "order_item": "order_items"}
+FEED_BATCH_INTERVAL_SECONDS = 1.0
+FEED_MAX_BATCH_BYTES = 1024 * 1024
+SNAPSHOT_PUBLISH_INTERVAL_SECONDS = 5.0
+
+# Columns accepted for appended records, with defaults for optional ones
+APPEND_COLUMNS = {
+    "customers": {
+        "customer_id": None,
+        "customer_name": None,
+        "email": None,
+        "registration_date": "now",
+        "customer_segment": None,
+    },
+    "orders": {
+        "order_id": None,
+        "customer_id": None,
+        "order_date": "now",
+        "total_amount": None,
+        "status": "completed",
+        "shipping_state": None,
+        "payment_method": None,
+    },
+    "order_items": {
+        "order_item_id": None,
+        "order_id": None,
+        "product_id": None,
+        "quantity": None,
+        "unit_price": None,
+        "total_price": None,
+    },
+}
+APPEND_REQUIRED = {
+    "customers": ("customer_id",),
+    "orders": ("order_id", "customer_id", "total_amount"),
+    "order_items": ("order_id", "product_id", "quantity", "unit_price"),
+}
+APPEND_TIMESTAMPS = ("registration_date", "order_date")
+# Numeric columns; every other non-timestamp column is stored as text
+APPEND_NUMERIC_TYPES = {
+    "order_item_id": int,
+    "quantity": int,
+    "total_amount": float,
+    "unit_price": float,
+    "total_price": float,
+}
+# SQLite stores integers as signed 64-bit values
+SQLITE_INT_RANGE = (-2**63, 2**63 - 1)
+
+# Largest limit served by the ranked (top-N) analyses
+TOP_N_MAX_LIMIT = 100
+
+# Query result cache. Entries are stamped with the versions of the tables they
+# read and served only while those versions are unchanged. Keys include client
+# supplied limits and filters, so the least recently used entries are evicted.
+QUERY_CACHE_TTL_SECONDS = 300
+QUERY_CACHE_MAX_ENTRIES = 256
+
+# Read-only snapshot shared by worker processes. When SNAPSHOT_PATH is set,
+# workers query the snapshot through SQLite memory-mapped I/O instead of running
+# load_data, waiting for ingestion to publish it if it does not exist yet.
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH")
+DEFAULT_SNAPSHOT_PATH = "ecommerce_snapshot.db"
+SNAPSHOT_MMAP_BYTES = 256 * 1024 * 1024
+SNAPSHOT_WAIT_SECONDS = 10.0
+SNAPSHOT_POLL_SECONDS = 0.5
+
+# All analysis SQL, keyed by analysis type. Queries may take a LIMIT parameter
+# and a {date_filter} placeholder filled from DATE_FILTERS.
+QUERY_CATALOG = {
+    "sales_overview_totals": """
+        SELECT 
+            COUNT(*) as total_orders,
+            SUM(total_amount) as total_revenue,
+            AVG(total_amount) as avg_order_value,
+            COUNT(DISTINCT customer_id) as unique_customers
+        FROM orders 
+        WHERE status = 'completed' {date_filter}
+    """,
+    "sales_overview_status": """
+        SELECT status, COUNT(*) as count, SUM(total_amount) as revenue
+        FROM orders
+        WHERE 1 = 1 {date_filter}
+        GROUP BY status
+    """,
+    "sales_overview_rollup_totals": """
+        SELECT 
+            COALESCE(SUM(total_orders), 0) as total_orders,
+            SUM(total_spent) as total_revenue,
+            SUM(total_spent) / SUM(total_orders) as avg_order_value,
+            COUNT(*) as unique_customers
+        FROM customer_sales
+    """,
+    "sales_overview_rollup_status": """
+        SELECT status, SUM(orders) as count, SUM(revenue) as revenue
+        FROM state_status_sales
+        GROUP BY status
+    """,
+    "sales_overview_rollup_states": """
+        SELECT shipping_state, orders, revenue
+        FROM state_status_sales
+        WHERE status = 'completed'
+        ORDER BY revenue DESC
+        LIMIT 5
+    """,
+    "sales_overview_states": """
+        SELECT shipping_state, COUNT(*) as orders, SUM(total_amount) as revenue
+        FROM orders 
+        WHERE status = 'completed' {date_filter}
+        GROUP BY shipping_state
+        ORDER BY revenue DESC
+        LIMIT 5
+    """,
+    "top_products": """
+        SELECT 
+            product_name,
+            category,
+            units_sold,
+            total_revenue,
+            price_sum / item_count as avg_price
+        FROM product_sales
+        WHERE item_count > 0
+        ORDER BY total_revenue DESC
+        LIMIT ?
+    """,
+    "top_products_by_category": """
+        SELECT 
+            product_name,
+            category,
+            units_sold,
+            total_revenue,
+            price_sum / item_count as avg_price
+        FROM product_sales
+        WHERE category = ? AND item_count > 0
+        ORDER BY total_revenue DESC
+        LIMIT ?
+    """,
+    "category_performance": """
+        SELECT 
+            p.category,
+            COUNT(DISTINCT p.product_id) as product_count,
+            SUM(oi.quantity) as total_units_sold,
+            SUM(oi.total_price) as total_revenue,
+            AVG(p.profit_margin) as avg_profit_margin
+        FROM products p
+        LEFT JOIN order_items oi ON p.product_id = oi.product_id
+        LEFT JOIN orders o ON oi.order_id = o.order_id AND o.status = 'completed'
+        GROUP BY p.category
+        ORDER BY total_revenue DESC
+        LIMIT ?
+    """,
+    "inventory_status": """
+        SELECT 
+            product_id,
+            product_name,
+            category,
+            stock_quantity,
+            price,
+            CASE 
+                WHEN stock_quantity = 0 THEN 'Out of Stock'
+                WHEN stock_quantity < 50 THEN 'Low Stock'
+                WHEN stock_quantity < 100 THEN 'Medium Stock'
+                ELSE 'High Stock'
+            END as stock_status
+        FROM products
+        ORDER BY stock_quantity ASC
+        LIMIT ?
+    """,
+    "profit_analysis": """
+        SELECT 
+            product_name,
+            category,
+            price,
+            cost,
+            profit_margin,
+            units_sold,
+            total_revenue as revenue,
+            total_cost,
+            total_profit
+        FROM product_sales
+        ORDER BY total_profit DESC
+        LIMIT ?
+    """,
+    "profit_analysis_by_category": """
+        SELECT 
+            product_name,
+            category,
+            price,
+            cost,
+            profit_margin,
+            units_sold,
+            total_revenue as revenue,
+            total_cost,
+            total_profit
+        FROM product_sales
+        WHERE category = ?
+        ORDER BY total_profit DESC
+        LIMIT ?
+    """,
+    "top_customers": """
+        SELECT 
+            customer_id,
+            customer_segment,
+            total_orders,
+            total_spent,
+            total_spent / total_orders as avg_order_value,
+            last_order_date
+        FROM customer_sales
+        ORDER BY total_spent DESC
+        LIMIT ?
+    """,
+    "top_customers_by_segment": """
+        SELECT 
+            customer_id,
+            customer_segment,
+            total_orders,
+            total_spent,
+            total_spent / total_orders as avg_order_value,
+            last_order_date
+        FROM customer_sales
+        WHERE customer_segment = ?
+        ORDER BY total_spent DESC
+        LIMIT ?
+    """,
+    "geographic_distribution": """
+        SELECT 
+            shipping_state,
+            COUNT(DISTINCT customer_id) as unique_customers,
+            COUNT(*) as total_orders,
+            SUM(total_amount) as total_revenue,
+            AVG(total_amount) as avg_order_value
+        FROM orders
+        WHERE status = 'completed'
+        GROUP BY shipping_state
+        ORDER BY total_revenue DESC
+        LIMIT ?
+    """,
+    "purchase_patterns": """
+        SELECT 
+            customer_type,
+            COUNT(*) as customer_count,
+            AVG(total_spent) as avg_customer_value
+        FROM (
+            SELECT 
+                c.customer_id,
+                CASE 
+                    WHEN COUNT(o.order_id) = 1 THEN 'One-time Buyer'
+                    WHEN COUNT(o.order_id) BETWEEN 2 AND 5 THEN 'Occasional Buyer'
+                    WHEN COUNT(o.order_id) BETWEEN 6 AND 10 THEN 'Regular Buyer'
+                    ELSE 'Frequent Buyer'
+                END as customer_type,
+                SUM(o.total_amount) as total_spent
+            FROM customers c
+            JOIN orders o ON c.customer_id = o.customer_id
+            WHERE o.status = 'completed'
+            GROUP BY c.customer_id
+        ) customer_orders
+        GROUP BY customer_type
+        ORDER BY avg_customer_value DESC
+    """,
+    "customer_lifetime_value": """
+        SELECT 
+            c.customer_segment,
+            COUNT(DISTINCT c.customer_id) as customer_count,
+            AVG(customer_stats.total_spent) as avg_lifetime_value,
+            AVG(customer_stats.total_orders) as avg_orders_per_customer,
+            AVG(customer_stats.days_active) as avg_customer_lifespan_days
+        FROM customers c
+        JOIN (
+            SELECT 
+                customer_id,
+                SUM(total_amount) as total_spent,
+                COUNT(*) as total_orders,
+                JULIANDAY(MAX(order_date)) - JULIANDAY(MIN(order_date)) as days_active
+            FROM orders
+            WHERE status = 'completed'
+            GROUP BY customer_id
+        ) customer_stats ON c.customer_id = customer_stats.customer_id
+        GROUP BY c.customer_segment
+        ORDER BY avg_lifetime_value DESC
+    """,
+    "monthly_trends": """
+        SELECT 
+            strftime('%Y-%m', order_date) as month,
+            COUNT(*) as orders,
+            SUM(total_amount) as revenue,
+            AVG(total_amount) as avg_order_value,
+            COUNT(DISTINCT customer_id) as unique_customers
+        FROM orders
+        WHERE status = 'completed'
+        GROUP BY strftime('%Y-%m', order_date)
+        ORDER BY month
+    """,
+    "daily_patterns": """
+        SELECT 
+            CASE cast(strftime('%w', order_date) as integer)
+                WHEN 0 THEN 'Sunday'
+                WHEN 1 THEN 'Monday'
+                WHEN 2 THEN 'Tuesday'
+                WHEN 3 THEN 'Wednesday'
+                WHEN 4 THEN 'Thursday'
+                WHEN 5 THEN 'Friday'
+                WHEN 6 THEN 'Saturday'
+            END as day_of_week,
+            COUNT(*) as orders,
+            SUM(total_amount) as revenue,
+            AVG(total_amount) as avg_order_value
+        FROM orders
+        WHERE status = 'completed'
+        GROUP BY strftime('%w', order_date)
+        ORDER BY cast(strftime('%w', order_date) as integer)
+    """,
+    "seasonal_analysis": """
+        SELECT 
+            CASE 
+                WHEN cast(strftime('%m', order_date) as integer) IN (12, 1, 2) THEN 'Winter'
+                WHEN cast(strftime('%m', order_date) as integer) IN (3, 4, 5) THEN 'Spring'
+                WHEN cast(strftime('%m', order_date) as integer) IN (6, 7, 8) THEN 'Summer'
+                ELSE 'Fall'
+            END as season,
+            COUNT(*) as orders,
+            SUM(total_amount) as revenue,
+            AVG(total_amount) as avg_order_value
+        FROM orders
+        WHERE status = 'completed'
+        GROUP BY season
+        ORDER BY revenue DESC
+    """,
+    "growth_rate": """
+        WITH monthly_sales AS (
+            SELECT 
+                strftime('%Y-%m', order_date) as month,
+                SUM(total_amount) as revenue
+            FROM orders
+            WHERE status = 'completed'
+            GROUP BY strftime('%Y-%m', order_date)
+            ORDER BY month
+        ),
+        growth_calc AS (
+            SELECT 
+                month,
+                revenue,
+                LAG(revenue) OVER (ORDER BY month) as prev_month_revenue
+            FROM monthly_sales
+        )
+        SELECT 
+            month,
+            revenue,
+            prev_month_revenue,
+            CASE 
+                WHEN prev_month_revenue IS NOT NULL THEN 
+                    ROUND(((revenue - prev_month_revenue) / prev_month_revenue * 100), 2)
+                ELSE NULL
+            END as growth_rate_percent
+        FROM growth_calc
+        ORDER BY month
+    """,
+    "custom_revenue_by_category": """
+        SELECT 
+            p.category,
+            SUM(oi.total_price) as revenue,
+            COUNT(DISTINCT o.order_id) as orders
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.product_id
+        JOIN orders o ON oi.order_id = o.order_id
+        WHERE o.status = 'completed'
+        GROUP BY p.category
+        ORDER BY revenue DESC
+    """,
+    "custom_top_selling": """
+        SELECT 
+            product_name,
+            units_sold,
+            total_revenue as revenue
+        FROM product_sales
+        WHERE item_count > 0
+        ORDER BY units_sold DESC
+        LIMIT 10
+    """,
+    "custom_overview": """
+        SELECT 
+            'Total Orders' as metric,
+            COUNT(*) as value
+        FROM orders
+        WHERE status = 'completed'
+        UNION ALL
+        SELECT 
+            'Total Revenue' as metric,
+            ROUND(SUM(total_amount), 2) as value
+        FROM orders
+        WHERE status = 'completed'
+    """,
+}
+
+PRODUCT_ANALYSES = ("top_products", "category_performance", "inventory_status", "profit_analysis")
+CUSTOMER_ANALYSES = ("top_customers", "geographic_distribution", "purchase_patterns", "customer_lifetime_value")
+TREND_ANALYSES = ("monthly_trends", "daily_patterns", "seasonal_analysis", "growth_rate")
+
+# Row counts each query must return against the probe dataset (one completed
+# order on the first of every month of 2024, which covers all seven weekdays)
+QUERY_PROBE_ROWS = {
+    "monthly_trends": 12,
+    "daily_patterns": 7,
+    "seasonal_analysis": 4,
+    "growth_rate": 12,
+    "purchase_patterns": 1,
+}
+PROBE_LIMIT = 100
+
+# Ranked queries that must be answered by walking a rollup index, never by
+# sorting; checked against the query plan when the catalog is compiled
+RANKED_QUERIES = (
+    "top_products",
+    "top_products_by_category",
+    "profit_analysis",
+    "profit_analysis_by_category",
+    "top_customers",
+    "top_customers_by_segment",
+    "custom_top_selling",
+)
+
+
+def compile_query_catalog() -> Dict[str, Dict[str, Any]]:
+    """Validate every catalog query against the schema and a probe dataset"""
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA_SQL)
+    conn.executescript(INDEX_SQL)
+    conn.execute("INSERT INTO customers VALUES ('CUST-0001', 'Customer 0', 'customer0@email.com', '2023-01-01 00:00:00', 'Regular')")
+    conn.execute("INSERT INTO products VALUES ('PROD-0001', 'Product 1', 'Books', 20.0, 10.0, 40, 50.0)")
+    conn.executemany(
+        "INSERT INTO orders VALUES (?, 'CUST-0001', ?, 100.0, 'completed', 'CA', 'credit_card')",
+        [(f'ORD-{month:06d}', f'2024-{month:02d}-01 00:00:00') for month in range(1, 13)]
+    )
+    conn.executemany(
+        "INSERT INTO order_items VALUES (?, ?, 'PROD-0001', 5, 20.0, 100.0)",
+        [(month, f'ORD-{month:06d}') for month in range(1, 13)]
+    )
+    conn.executescript(ROLLUP_SQL)
+    
+    catalog = {}
+    errors = []
+    for name, template in QUERY_CATALOG.items():
+        param_count = template.count('?')
+        filters = DATE_FILTERS.values() if '{date_filter}' in template else [""]
+        try:
+            for date_filter in filters:
+                rows = conn.execute(template.format(date_filter=date_filter), [PROBE_LIMIT] * param_count).fetchall()
+        except sqlite3.Error as e:
+            errors.append(f"{name}: {e}")
+            continue
+        expected_rows = QUERY_PROBE_ROWS.get(name)
+        if expected_rows is not None and len(rows) != expected_rows:
+            errors.append(f"{name}: expected {expected_rows} rows from probe data, got {len(rows)}")
+            continue
+        if name in RANKED_QUERIES:
+            plan = " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {template}", [PROBE_LIMIT] * param_count))
+            if "TEMP B-TREE" in plan:
+                errors.append(f"{name}: ranked query is not served by an index ({plan})")
+                continue
+        tables = [table for table in TABLE_NAMES + ROLLUP_TABLES if re.search(rf"\b{table}\b", template)]
+        catalog[name] = {"sql": template, "params": param_count, "tables": tables}
+    
+    conn.close()
+    if errors:
+        raise ValueError(f"Invalid queries in catalog: {'; '.join(errors)}")
+    return catalog
+
 class EcommerceMCPServer:
     def __init__(self):
+        started = time.perf_counter()
         self.server = Server("ecommerce-analytics")
         self.db_path = "ecommerce_data.db"
+        self.snapshot_path = SNAPSHOT_PATH
         self.data_loaded = False
+        self.tools = None
+        self.query_cache = OrderedDict()
+        self.feed_lock = None
+        
+        catalog_started = time.perf_counter()
+        self.query_catalog = compile_query_catalog()
+        catalog_seconds = time.perf_counter() - catalog_started
+        
         self.setup_server()
+        self.startup_profile = {
+            "module_import": MODULE_IMPORT_SECONDS,
+            "query_catalog": catalog_seconds,
+            "server_init": time.perf_counter() - started,
+        }
+        logger.info(f"Startup profile: {json.dumps({k: round(v, 4) for k, v in self.startup_profile.items()})}")
     
     def setup_server(self):
         """Setup MCP server with tools and resources"""
@@ -43,101 +811,9 @@ class EcommerceMCPServer:
         # Register tools
         @self.server.list_tools()
         async def handle_list_tools() -> List[Tool]:
-            return [
-                Tool(
-                    name="sales_overview",
-                    description="Get overall sales performance metrics and KPIs",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "date_range": {
-                                "type": "string",
-                                "description": "Date range filter (e.g., 'last_30_days', 'this_month', 'this_year')",
-                                "default": "all"
-                            }
-                        }
-                    }
-                ),
-                Tool(
-                    name="product_analysis",
-                    description="Analyze product performance, top sellers, and inventory insights",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "analysis_type": {
-                                "type": "string",
-                                "enum": ["top_products", "category_performance", "inventory_status", "profit_analysis"],
-                                "description": "Type of product analysis to perform"
-                            },
-                            "limit": {
-                                "type": "integer",
-                                "description": "Number of results to return",
-                                "default": 10
-                            }
-                        },
-                        "required": ["analysis_type"]
-                    }
-                ),
-                Tool(
-                    name="customer_insights",
-                    description="Analyze customer behavior, segments, and lifetime value",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "insight_type": {
-                                "type": "string",
-                                "enum": ["top_customers", "geographic_distribution", "purchase_patterns", "customer_lifetime_value"],
-                                "description": "Type of customer analysis"
-                            },
-                            "limit": {
-                                "type": "integer",
-                                "description": "Number of results to return",
-                                "default": 10
-                            }
-                        },
-                        "required": ["insight_type"]
-                    }
-                ),
-                Tool(
-                    name="sales_trends",
-                    description="Analyze sales trends over time, seasonality, and forecasting",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "trend_type": {
-                                "type": "string",
-                                "enum": ["monthly_trends", "daily_patterns", "seasonal_analysis", "growth_rate"],
-                                "description": "Type of trend analysis"
-                            },
-                            "period": {
-                                "type": "string",
-                                "description": "Time period for analysis",
-                                "default": "all"
-                            }
-                        },
-                        "required": ["trend_type"]
-                    }
-                ),
-                Tool(
-                    name="custom_query",
-                    description="Execute custom SQL-like queries on the sales data",
-                    inputSchema={
-                        "type": "object",
-                        "properties": {
-                            "query_description": {
-                                "type": "string",
-                                "description": "Natural language description of what you want to analyze"
-                            },
-                            "filters": {
-                                "type": "object",
-                                "description": "Optional filters (date_range, category, region, etc.)",
-                                "default": {}
-                            }
-                        },
-                        "required": ["query_description"]
-                    }
-                )
-            ]
+            if self.tools is None:
+                self.tools = self.build_tool_definitions()
+            return self.tools
         
         @self.server.call_tool()
         async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
@@ -151,12 +827,14 @@ class EcommerceMCPServer:
                 elif name == "product_analysis":
                     result = await self.analyze_products(
                         arguments["analysis_type"], 
-                        arguments.get("limit", 10)
+                        arguments.get("limit", 10),
+                        arguments.get("category")
                     )
                 elif name == "customer_insights":
                     result = await self.analyze_customers(
                         arguments["insight_type"],
-                        arguments.get("limit", 10)
+                        arguments.get("limit", 10),
+                        arguments.get("segment")
                     )
                 elif name == "sales_trends":
                     result = await self.analyze_trends(
@@ -168,6 +846,12 @@ class EcommerceMCPServer:
                         arguments["query_description"],
                         arguments.get("filters", {})
                     )
+                elif name == "append_orders":
+                    result = await self.apply_change_batch(
+                        arguments.get("customers", []),
+                        arguments.get("orders", []),
+                        arguments.get("order_items", [])
+                    )
                 else:
                     result = {"error": f"Unknown tool: {name}"}
                 
@@ -177,19 +861,180 @@ class EcommerceMCPServer:
                 logger.error(f"Error in tool {name}: {str(e)}")
                 return [TextContent(type="text", text=f"Error: {str(e)}")]
 
+    def build_tool_definitions(self) -> List[Tool]:
+        """Build the tool schemas advertised to clients (done once, on first listing)"""
+        return [
+            Tool(
+                name="sales_overview",
+                description="Get overall sales performance metrics and KPIs",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "date_range": {
+                            "type": "string",
+                            "description": "Date range filter (e.g., 'last_30_days', 'this_month', 'this_year')",
+                            "default": "all"
+                        }
+                    }
+                }
+            ),
+            Tool(
+                name="product_analysis",
+                description="Analyze product performance, top sellers, and inventory insights",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "analysis_type": {
+                            "type": "string",
+                            "enum": list(PRODUCT_ANALYSES),
+                            "description": "Type of product analysis to perform"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": f"Number of results to return (at most {TOP_N_MAX_LIMIT} for top_products and profit_analysis)",
+                            "default": 10
+                        },
+                        "category": {
+                            "type": "string",
+                            "description": "Rank within a single product category (top_products and profit_analysis)"
+                        }
+                    },
+                    "required": ["analysis_type"]
+                }
+            ),
+            Tool(
+                name="customer_insights",
+                description="Analyze customer behavior, segments, and lifetime value",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "insight_type": {
+                            "type": "string",
+                            "enum": list(CUSTOMER_ANALYSES),
+                            "description": "Type of customer analysis"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": f"Number of results to return (at most {TOP_N_MAX_LIMIT} for top_customers)",
+                            "default": 10
+                        },
+                        "segment": {
+                            "type": "string",
+                            "description": "Rank within a single customer segment (top_customers)"
+                        }
+                    },
+                    "required": ["insight_type"]
+                }
+            ),
+            Tool(
+                name="sales_trends",
+                description="Analyze sales trends over time, seasonality, and forecasting",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "trend_type": {
+                            "type": "string",
+                            "enum": list(TREND_ANALYSES),
+                            "description": "Type of trend analysis"
+                        },
+                        "period": {
+                            "type": "string",
+                            "description": "Time period for analysis",
+                            "default": "all"
+                        }
+                    },
+                    "required": ["trend_type"]
+                }
+            ),
+            Tool(
+                name="custom_query",
+                description="Execute custom SQL-like queries on the sales data",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "query_description": {
+                            "type": "string",
+                            "description": "Natural language description of what you want to analyze"
+                        },
+                        "filters": {
+                            "type": "object",
+                            "description": "Optional filters (date_range, category, region, etc.)",
+                            "default": {}
+                        }
+                    },
+                    "required": ["query_description"]
+                }
+            ),
+            Tool(
+                name="append_orders",
+                description="Append new customers, orders and order items and update the sales aggregates",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "customers": {
+                            "type": "array",
+                            "items": {"type": "object"},
+                            "description": "New customers (customer_id required)",
+                            "default": []
+                        },
+                        "orders": {
+                            "type": "array",
+                            "items": {"type": "object"},
+                            "description": "New orders (order_id, customer_id and total_amount required)",
+                            "default": []
+                        },
+                        "order_items": {
+                            "type": "array",
+                            "items": {"type": "object"},
+                            "description": "New order items (order_id, product_id, quantity and unit_price required)",
+                            "default": []
+                        }
+                    }
+                }
+            )
+        ]
+
     async def load_data(self):
         """Load and process the e-commerce data"""
+        if self.snapshot_path:
+            await self.wait_for_snapshot()
+            conn = self.connect()
+            try:
+                snapshot_version = conn.execute("PRAGMA user_version").fetchone()[0]
+            finally:
+                conn.close()
+            
+            if snapshot_version == ROLLUP_VERSION:
+                # Snapshot workers never write; the ingestion process owns the database
+                self.data_loaded = True
+                logger.info(f"Serving read-only snapshot at {self.snapshot_path}")
+                return
+            
+            logger.warning(
+                f"Ignoring snapshot {self.snapshot_path}: rollup version {snapshot_version} does not match "
+                f"{ROLLUP_VERSION}, re-export it with --export-snapshot. Loading {self.db_path} instead"
+            )
+            self.snapshot_path = None
+        
         try:
             # Initialize database
             conn = sqlite3.connect(self.db_path)
             
-            # Sample data structure based on typical e-commerce datasets
-            # You would replace this with actual CSV loading from Kaggle
-            sample_data = self.generate_sample_data()
-            
-            # Create tables and load data
-            for table_name, df in sample_data.items():
-                df.to_sql(table_name, conn, if_exists='replace', index=False)
+            if self.tables_ready(conn):
+                logger.info(f"Reusing existing database at {self.db_path}")
+                rollup_version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if rollup_version != ROLLUP_VERSION or not self.tables_ready(conn, ROLLUP_TABLES):
+                    self.build_indexes_and_rollups(conn)
+            else:
+                # Sample data structure based on typical e-commerce datasets
+                # You would replace this with actual CSV loading from Kaggle
+                sample_data = self.generate_sample_data()
+                
+                # Create tables and load data
+                self.create_tables(conn)
+                for table_name, df in sample_data.items():
+                    df.to_sql(table_name, conn, if_exists='append', index=False)
+                self.build_indexes_and_rollups(conn)
             
             conn.close()
             self.data_loaded = True
@@ -199,6 +1044,72 @@ class EcommerceMCPServer:
             logger.error(f"Error loading data: {str(e)}")
             raise
 
+    async def wait_for_snapshot(self):
+        """Wait for ingestion to publish the first snapshot, failing loudly rather than using the database"""
+        waited = 0.0
+        while not Path(self.snapshot_path).exists():
+            if waited >= SNAPSHOT_WAIT_SECONDS:
+                message = (
+                    f"Snapshot {self.snapshot_path} has not been published after {SNAPSHOT_WAIT_SECONDS:g}s; "
+                    f"start the ingestion process or run --export-snapshot first"
+                )
+                logger.error(message)
+                raise FileNotFoundError(message)
+            if waited == 0:
+                logger.info(f"Waiting for snapshot {self.snapshot_path} to be published")
+            await asyncio.sleep(SNAPSHOT_POLL_SECONDS)
+            waited += SNAPSHOT_POLL_SECONDS
+
+    def tables_ready(self, conn: sqlite3.Connection, tables: tuple = TABLE_NAMES) -> bool:
+        """Check whether every table already exists and holds data"""
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if not set(tables) <= existing:
+            return False
+        return all(conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() for table in tables)
+
+    def create_tables(self, conn: sqlite3.Connection):
+        """Drop and recreate the tables from SCHEMA_SQL"""
+        conn.executescript("".join(f"DROP TABLE IF EXISTS {table};" for table in TABLE_NAMES))
+        conn.executescript(SCHEMA_SQL)
+        # Regenerated data starts every feed over from the beginning
+        conn.executescript(INGEST_STATE_SQL + "DELETE FROM ingest_state WHERE key LIKE 'feed_offset:%';")
+
+    def build_indexes_and_rollups(self, conn: sqlite3.Connection):
+        """Index the base tables and rebuild the precomputed rollups"""
+        conn.executescript(INDEX_SQL)
+        conn.executescript(ROLLUP_SQL)
+        conn.executescript(INGEST_STATE_SQL)
+        self.bump_table_versions(conn, TABLE_NAMES + ROLLUP_TABLES)
+        conn.execute(f"PRAGMA user_version = {ROLLUP_VERSION}")
+        conn.commit()
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a connection to the snapshot if one is being served, else the database"""
+        if not self.snapshot_path:
+            return sqlite3.connect(self.db_path)
+        
+        # immutable=1 skips locking; snapshots are replaced, never modified in place
+        conn = sqlite3.connect(f"{Path(self.snapshot_path).resolve().as_uri()}?mode=ro&immutable=1", uri=True)
+        conn.execute(f"PRAGMA mmap_size = {SNAPSHOT_MMAP_BYTES}")
+        return conn
+
+    def export_snapshot(self, snapshot_path: str) -> str:
+        """Write the loaded tables, indexes and rollups to a snapshot and swap it in atomically"""
+        target = Path(snapshot_path).resolve()
+        staging = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        staging.unlink(missing_ok=True)
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("VACUUM INTO ?", (str(staging),))
+        finally:
+            conn.close()
+        
+        # os.replace is atomic; readers holding the old file keep their open handle
+        os.replace(staging, target)
+        logger.info(f"Snapshot written to {target}")
+        return str(target)
+
     def generate_sample_data(self) -> Dict[str, pd.DataFrame]:
         """Generate sample e-commerce data (replace with actual CSV loading)"""
         np.random.seed(42)
@@ -260,46 +1171,78 @@ class EcommerceMCPServer:
             'customers': customers_df
         }
 
+    def run_query(self, conn: sqlite3.Connection, name: str, limit: Optional[int] = None, date_filter: str = "", filters: tuple = ()) -> pd.DataFrame:
+        """Execute a query from the validated catalog, serving repeats from the cache"""
+        entry = self.query_catalog[name]
+        # Read the stamp from conn itself, so writes by other processes and
+        # swapped-in snapshots are both seen
+        versions = self.table_versions(conn, entry["tables"])
+        
+        key = (name, limit, date_filter, filters)
+        cached = self.query_cache.get(key)
+        if cached is not None and cached[1] == versions and time.monotonic() - cached[0] < QUERY_CACHE_TTL_SECONDS:
+            self.query_cache.move_to_end(key)
+            return cached[2]
+        
+        query = entry["sql"].format(date_filter=date_filter)
+        params = list(filters) + [limit] * (entry["params"] - len(filters))
+        results = pd.read_sql_query(query, conn, params=params)
+        self.query_cache[key] = (time.monotonic(), versions, results)
+        self.query_cache.move_to_end(key)
+        while len(self.query_cache) > QUERY_CACHE_MAX_ENTRIES:
+            self.query_cache.popitem(last=False)
+        return results
+
+    def table_versions(self, conn: sqlite3.Connection, tables: list) -> tuple:
+        """Read the change counters of the given tables from ingest_state"""
+        keys = [f"version:{table}" for table in tables]
+        rows = dict(conn.execute(
+            f"SELECT key, value FROM ingest_state WHERE key IN ({', '.join('?' * len(keys))})", keys
+        ).fetchall())
+        return tuple(rows.get(key, 0) for key in keys)
+
+    def bump_table_versions(self, conn: sqlite3.Connection, tables):
+        """Advance the change counters of the given tables in the current transaction"""
+        conn.executemany(
+            "INSERT INTO ingest_state VALUES (?, 1) ON CONFLICT (key) DO UPDATE SET value = value + 1",
+            [(f"version:{table}",) for table in tables]
+        )
+
+    def ranked_query(self, analysis_type: str, group: Optional[str], suffix: str) -> tuple:
+        """Pick the per-group variant of a ranked query when a group is requested"""
+        if group is not None and f"{analysis_type}{suffix}" in self.query_catalog:
+            return f"{analysis_type}{suffix}", (group,)
+        return analysis_type, ()
+
+    def clamp_limit(self, query_name: str, limit: int) -> int:
+        """Keep ranked query limits within what the top-N indexes are meant to serve
+
+        Raises ValueError for a ranked limit below 1, which would otherwise
+        return nothing (0) or every row (negative).
+        """
+        if query_name not in RANKED_QUERIES:
+            return limit
+        if int(limit) < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}")
+        return min(int(limit), TOP_N_MAX_LIMIT)
+
     async def get_sales_overview(self, date_range: str) -> Dict[str, Any]:
         """Get overall sales performance metrics"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         
         # Build date filter
         date_filter = self.build_date_filter(date_range)
         
-        # Total sales
-        total_sales_query = f"""
-        SELECT 
-            COUNT(*) as total_orders,
-            SUM(total_amount) as total_revenue,
-            AVG(total_amount) as avg_order_value,
-            COUNT(DISTINCT customer_id) as unique_customers
-        FROM orders 
-        WHERE status = 'completed' {date_filter}
-        """
-        
-        sales_metrics = pd.read_sql_query(total_sales_query, conn)
-        
-        # Sales by status
-        status_query = f"""
-        SELECT status, COUNT(*) as count, SUM(total_amount) as revenue
-        FROM orders {('WHERE ' + date_filter.replace('AND ', '')) if date_filter else ''}
-        GROUP BY status
-        """
-        
-        status_breakdown = pd.read_sql_query(status_query, conn)
-        
-        # Top states by sales
-        state_query = f"""
-        SELECT shipping_state, COUNT(*) as orders, SUM(total_amount) as revenue
-        FROM orders 
-        WHERE status = 'completed' {date_filter}
-        GROUP BY shipping_state
-        ORDER BY revenue DESC
-        LIMIT 5
-        """
-        
-        top_states = pd.read_sql_query(state_query, conn)
+        # Total sales, sales by status and top states by sales; the unfiltered
+        # overview is served from the maintained rollups
+        if date_filter:
+            sales_metrics = self.run_query(conn, "sales_overview_totals", date_filter=date_filter)
+            status_breakdown = self.run_query(conn, "sales_overview_status", date_filter=date_filter)
+            top_states = self.run_query(conn, "sales_overview_states", date_filter=date_filter)
+        else:
+            sales_metrics = self.run_query(conn, "sales_overview_rollup_totals")
+            status_breakdown = self.run_query(conn, "sales_overview_rollup_status")
+            top_states = self.run_query(conn, "sales_overview_rollup_states")
         
         conn.close()
         
@@ -311,268 +1254,57 @@ class EcommerceMCPServer:
             "insights": self.generate_sales_insights(sales_metrics.iloc[0])
         }
 
-    async def analyze_products(self, analysis_type: str, limit: int) -> Dict[str, Any]:
+    async def analyze_products(self, analysis_type: str, limit: int, category: Optional[str] = None) -> Dict[str, Any]:
         """Analyze product performance"""
-        conn = sqlite3.connect(self.db_path)
+        if analysis_type not in PRODUCT_ANALYSES:
+            return {"error": f"Unknown analysis type: {analysis_type}"}
         
-        if analysis_type == "top_products":
-            query = """
-            SELECT 
-                p.product_name,
-                p.category,
-                SUM(oi.quantity) as units_sold,
-                SUM(oi.total_price) as total_revenue,
-                AVG(oi.unit_price) as avg_price
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.product_id
-            JOIN orders o ON oi.order_id = o.order_id
-            WHERE o.status = 'completed'
-            GROUP BY p.product_id, p.product_name, p.category
-            ORDER BY total_revenue DESC
-            LIMIT ?
-            """
-            
-        elif analysis_type == "category_performance":
-            query = """
-            SELECT 
-                p.category,
-                COUNT(DISTINCT p.product_id) as product_count,
-                SUM(oi.quantity) as total_units_sold,
-                SUM(oi.total_price) as total_revenue,
-                AVG(p.profit_margin) as avg_profit_margin
-            FROM products p
-            LEFT JOIN order_items oi ON p.product_id = oi.product_id
-            LEFT JOIN orders o ON oi.order_id = o.order_id AND o.status = 'completed'
-            GROUP BY p.category
-            ORDER BY total_revenue DESC
-            LIMIT ?
-            """
-            
-        elif analysis_type == "inventory_status":
-            query = """
-            SELECT 
-                product_id,
-                product_name,
-                category,
-                stock_quantity,
-                price,
-                CASE 
-                    WHEN stock_quantity = 0 THEN 'Out of Stock'
-                    WHEN stock_quantity < 50 THEN 'Low Stock'
-                    WHEN stock_quantity < 100 THEN 'Medium Stock'
-                    ELSE 'High Stock'
-                END as stock_status
-            FROM products
-            ORDER BY stock_quantity ASC
-            LIMIT ?
-            """
-            
-        elif analysis_type == "profit_analysis":
-            query = """
-            SELECT 
-                p.product_name,
-                p.category,
-                p.price,
-                p.cost,
-                p.profit_margin,
-                COALESCE(SUM(oi.quantity), 0) as units_sold,
-                COALESCE(SUM(oi.total_price), 0) as revenue,
-                COALESCE(SUM(oi.quantity * p.cost), 0) as total_cost,
-                COALESCE(SUM(oi.total_price) - SUM(oi.quantity * p.cost), 0) as total_profit
-            FROM products p
-            LEFT JOIN order_items oi ON p.product_id = oi.product_id
-            LEFT JOIN orders o ON oi.order_id = o.order_id AND o.status = 'completed'
-            GROUP BY p.product_id
-            ORDER BY total_profit DESC
-            LIMIT ?
-            """
-        
-        results = pd.read_sql_query(query, conn, params=[limit])
+        query_name, filters = self.ranked_query(analysis_type, category, "_by_category")
+        try:
+            limit = self.clamp_limit(query_name, limit)
+        except ValueError as e:
+            return {"error": str(e)}
+        conn = self.connect()
+        results = self.run_query(conn, query_name, limit=limit, filters=filters)
         conn.close()
         
         return {
             "analysis_type": analysis_type,
+            "category": filters[0] if filters else None,
+            "limit": limit,
             "results": results.to_dict('records'),
             "insights": self.generate_product_insights(analysis_type, results)
         }
 
-    async def analyze_customers(self, insight_type: str, limit: int) -> Dict[str, Any]:
+    async def analyze_customers(self, insight_type: str, limit: int, segment: Optional[str] = None) -> Dict[str, Any]:
         """Analyze customer behavior and segments"""
-        conn = sqlite3.connect(self.db_path)
+        if insight_type not in CUSTOMER_ANALYSES:
+            return {"error": f"Unknown insight type: {insight_type}"}
         
-        if insight_type == "top_customers":
-            query = """
-            SELECT 
-                c.customer_id,
-                c.customer_segment,
-                COUNT(o.order_id) as total_orders,
-                SUM(o.total_amount) as total_spent,
-                AVG(o.total_amount) as avg_order_value,
-                MAX(o.order_date) as last_order_date
-            FROM customers c
-            JOIN orders o ON c.customer_id = o.customer_id
-            WHERE o.status = 'completed'
-            GROUP BY c.customer_id
-            ORDER BY total_spent DESC
-            LIMIT ?
-            """
-            
-        elif insight_type == "geographic_distribution":
-            query = """
-            SELECT 
-                shipping_state,
-                COUNT(DISTINCT customer_id) as unique_customers,
-                COUNT(*) as total_orders,
-                SUM(total_amount) as total_revenue,
-                AVG(total_amount) as avg_order_value
-            FROM orders
-            WHERE status = 'completed'
-            GROUP BY shipping_state
-            ORDER BY total_revenue DESC
-            LIMIT ?
-            """
-            
-        elif insight_type == "purchase_patterns":
-            query = """
-            SELECT 
-                CASE 
-                    WHEN COUNT(o.order_id) = 1 THEN 'One-time Buyer'
-                    WHEN COUNT(o.order_id) BETWEEN 2 AND 5 THEN 'Occasional Buyer'
-                    WHEN COUNT(o.order_id) BETWEEN 6 AND 10 THEN 'Regular Buyer'
-                    ELSE 'Frequent Buyer'
-                END as customer_type,
-                COUNT(DISTINCT c.customer_id) as customer_count,
-                AVG(SUM(o.total_amount)) as avg_customer_value
-            FROM customers c
-            JOIN orders o ON c.customer_id = o.customer_id
-            WHERE o.status = 'completed'
-            GROUP BY c.customer_id
-            HAVING COUNT(o.order_id) > 0
-            GROUP BY customer_type
-            ORDER BY avg_customer_value DESC
-            """
-            
-        elif insight_type == "customer_lifetime_value":
-            query = """
-            SELECT 
-                c.customer_segment,
-                COUNT(DISTINCT c.customer_id) as customer_count,
-                AVG(customer_stats.total_spent) as avg_lifetime_value,
-                AVG(customer_stats.total_orders) as avg_orders_per_customer,
-                AVG(customer_stats.days_active) as avg_customer_lifespan_days
-            FROM customers c
-            JOIN (
-                SELECT 
-                    customer_id,
-                    SUM(total_amount) as total_spent,
-                    COUNT(*) as total_orders,
-                    JULIANDAY(MAX(order_date)) - JULIANDAY(MIN(order_date)) as days_active
-                FROM orders
-                WHERE status = 'completed'
-                GROUP BY customer_id
-            ) customer_stats ON c.customer_id = customer_stats.customer_id
-            GROUP BY c.customer_segment
-            ORDER BY avg_lifetime_value DESC
-            """
-        
-        results = pd.read_sql_query(query, conn, params=[limit] if insight_type != "customer_lifetime_value" and insight_type != "purchase_patterns" else [])
+        query_name, filters = self.ranked_query(insight_type, segment, "_by_segment")
+        try:
+            limit = self.clamp_limit(query_name, limit)
+        except ValueError as e:
+            return {"error": str(e)}
+        conn = self.connect()
+        results = self.run_query(conn, query_name, limit=limit, filters=filters)
         conn.close()
         
         return {
             "insight_type": insight_type,
+            "segment": filters[0] if filters else None,
+            "limit": limit,
             "results": results.to_dict('records'),
             "insights": self.generate_customer_insights(insight_type, results)
         }
 
     async def analyze_trends(self, trend_type: str, period: str) -> Dict[str, Any]:
         """Analyze sales trends over time"""
-        conn = sqlite3.connect(self.db_path)
-        
-        if trend_type == "monthly_trends":
-            query = """
-            SELECT 
-                strftime('%Y-%m', order_date) as month,
-                COUNT(*) as orders,
-                SUM(total_amount) as revenue,
-                AVG(total_amount) as avg_order_value,
-                COUNT(DISTINCT customer_id) as unique_customers
-            FROM orders
-            WHERE status = 'completed'
-            GROUP BY strftime('%Y-%m', order_date)
-            ORDER BY month
-            """
-            
-        elif trend_type == "daily_patterns":
-            query = """
-            SELECT 
-                CASE cast(strftime('%w', order_date) as integer)
-                    WHEN 0 THEN 'Sunday'
-                    WHEN 1 THEN 'Monday'
-                    WHEN 2 THEN 'Tuesday'
-                    WHEN 3 THEN 'Wednesday'
-                    WHEN 4 THEN 'Thursday'
-                    WHEN 5 THEN 'Friday'
-                    WHEN 6 THEN 'Saturday'
-                END as day_of_week,
-                COUNT(*) as orders,
-                SUM(total_amount) as revenue,
-                AVG(total_amount) as avg_order_value
-            FROM orders
-            WHERE status = 'completed'
-            GROUP BY strftime('%w', order_date)
-            ORDER BY cast(strftime('%w', order_date) as integer)
-            """
-            
-        elif trend_type == "seasonal_analysis":
-            query = """
-            SELECT 
-                CASE cast(strftime('%m', order_date) as integer)
-                    WHEN 12 OR cast(strftime('%m', order_date) as integer) IN (1,2) THEN 'Winter'
-                    WHEN cast(strftime('%m', order_date) as integer) IN (3,4,5) THEN 'Spring'
-                    WHEN cast(strftime('%m', order_date) as integer) IN (6,7,8) THEN 'Summer'
-                    ELSE 'Fall'
-                END as season,
-                COUNT(*) as orders,
-                SUM(total_amount) as revenue,
-                AVG(total_amount) as avg_order_value
-            FROM orders
-            WHERE status = 'completed'
-            GROUP BY season
-            ORDER BY revenue DESC
-            """
-            
-        elif trend_type == "growth_rate":
-            query = """
-            WITH monthly_sales AS (
-                SELECT 
-                    strftime('%Y-%m', order_date) as month,
-                    SUM(total_amount) as revenue
-                FROM orders
-                WHERE status = 'completed'
-                GROUP BY strftime('%Y-%m', order_date)
-                ORDER BY month
-            ),
-            growth_calc AS (
-                SELECT 
-                    month,
-                    revenue,
-                    LAG(revenue) OVER (ORDER BY month) as prev_month_revenue
-                FROM monthly_sales
-            )
-            SELECT 
-                month,
-                revenue,
-                prev_month_revenue,
-                CASE 
-                    WHEN prev_month_revenue IS NOT NULL THEN 
-                        ROUND(((revenue - prev_month_revenue) / prev_month_revenue * 100), 2)
-                    ELSE NULL
-                END as growth_rate_percent
-            FROM growth_calc
-            ORDER BY month
-            """
+        if trend_type not in TREND_ANALYSES:
+            return {"error": f"Unknown trend type: {trend_type}"}
         
-        results = pd.read_sql_query(query, conn)
+        conn = self.connect()
+        results = self.run_query(conn, trend_type)
         conn.close()
         
         return {
@@ -587,55 +1319,20 @@ class EcommerceMCPServer:
         # This is a simplified implementation - in practice, you'd use NLP to convert
         # natural language to SQL queries
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connect()
         
         # Simple keyword-based query mapping
         query_lower = query_description.lower()
         
         if "revenue" in query_lower and "by category" in query_lower:
-            query = """
-            SELECT 
-                p.category,
-                SUM(oi.total_price) as revenue,
-                COUNT(DISTINCT o.order_id) as orders
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.product_id
-            JOIN orders o ON oi.order_id = o.order_id
-            WHERE o.status = 'completed'
-            GROUP BY p.category
-            ORDER BY revenue DESC
-            """
+            query_name = "custom_revenue_by_category"
         elif "top selling" in query_lower:
-            query = """
-            SELECT 
-                p.product_name,
-                SUM(oi.quantity) as units_sold,
-                SUM(oi.total_price) as revenue
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.product_id
-            JOIN orders o ON oi.order_id = o.order_id
-            WHERE o.status = 'completed'
-            GROUP BY p.product_id, p.product_name
-            ORDER BY units_sold DESC
-            LIMIT 10
-            """
+            query_name = "custom_top_selling"
         else:
             # Default query - sales overview
-            query = """
-            SELECT 
-                'Total Orders' as metric,
-                COUNT(*) as value
-            FROM orders
-            WHERE status = 'completed'
-            UNION ALL
-            SELECT 
-                'Total Revenue' as metric,
-                ROUND(SUM(total_amount), 2) as value
-            FROM orders
-            WHERE status = 'completed'
-            """
+            query_name = "custom_overview"
         
-        results = pd.read_sql_query(query, conn)
+        results = self.run_query(conn, query_name)
         conn.close()
         
         return {
@@ -645,23 +1342,292 @@ class EcommerceMCPServer:
             "interpretation": f"Analysis for: {query_description}"
         }
 
+    async def apply_change_batch(self, customers: List[Dict[str, Any]], orders: List[Dict[str, Any]], order_items: List[Dict[str, Any]], feed_position: Optional[tuple] = None) -> Dict[str, Any]:
+        """Append one micro-batch of records and update the rollups incrementally
+
+        feed_position is a (feed key, offset) pair saved with the batch, so a
+        restarted tailer resumes after the last applied line.
+        """
+        if self.snapshot_path:
+            return {"error": "This worker serves a read-only snapshot; send changes to the ingestion process"}
+        if not self.data_loaded:
+            await self.load_data()
+        
+        # Invalid records are rejected one at a time; the rest of the batch still applies
+        rejected = []
+        rows = {}
+        for table, records in (("customers", customers), ("orders", orders), ("order_items", order_items)):
+            rows[table] = []
+            for index, record in enumerate(records):
+                try:
+                    rows[table].append((index, self.prepare_append_row(table, record, feed_position is not None)))
+                except ValueError as e:
+                    rejected.append({"table": table, "index": index, "error": str(e)})
+        
+        appended = {table: 0 for table in rows}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS batch_orders (order_id TEXT PRIMARY KEY)")
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS batch_order_items (order_item_id INTEGER PRIMARY KEY)")
+                conn.execute("DELETE FROM batch_orders")
+                conn.execute("DELETE FROM batch_order_items")
+                
+                for table in ("customers", "orders", "order_items"):
+                    table_rows = rows[table]
+                    if table == "order_items":
+                        table_rows = self.check_item_references(conn, table_rows, rejected)
+                    columns = list(APPEND_COLUMNS[table])
+                    insert = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                    
+                    for index, row in table_rows:
+                        try:
+                            cursor = conn.execute(insert, row)
+                        except sqlite3.OperationalError:
+                            # Locking and I/O failures abort the batch so it is retried
+                            raise
+                        except (sqlite3.Error, OverflowError) as e:
+                            # Only the failing statement is rolled back, not the batch
+                            rejected.append({"table": table, "index": index, "error": str(e)})
+                            continue
+                        appended[table] += 1
+                        
+                        if table == "customers":
+                            conn.execute("UPDATE customer_sales SET customer_segment = ? WHERE customer_id = ?", (row[4], row[0]))
+                        elif table == "orders":
+                            conn.execute("INSERT INTO batch_orders VALUES (?)", (row[0],))
+                        else:
+                            # Items may omit order_item_id, so stage the ids SQLite assigns
+                            conn.execute("INSERT INTO batch_order_items VALUES (?)", (cursor.lastrowid,))
+                
+                for statement in INCREMENTAL_ROLLUP_STATEMENTS:
+                    conn.execute(statement)
+                if any(appended.values()):
+                    self.bump_table_versions(conn, [table for table, count in appended.items() if count] + list(ROLLUP_TABLES))
+                if feed_position is not None:
+                    conn.execute(
+                        "INSERT INTO ingest_state VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                        feed_position
+                    )
+        finally:
+            conn.close()
+        
+        return {
+            "appended": appended,
+            "rejected": rejected,
+            "applied_at": datetime.now().isoformat(timespec="seconds")
+        }
+
+    def prepare_append_row(self, table: str, record: Dict[str, Any], from_feed: bool = False) -> tuple:
+        """Validate and coerce one appended record, ordering its values like APPEND_COLUMNS"""
+        if not isinstance(record, dict):
+            raise ValueError(f"{table} records must be JSON objects, got {type(record).__name__}")
+        columns = APPEND_COLUMNS[table]
+        unknown = set(record) - set(columns)
+        if unknown:
+            raise ValueError(f"Unknown {table} fields: {', '.join(sorted(map(str, unknown)))}")
+        
+        values = {}
+        for column, default in columns.items():
+            # An explicit null counts as a missing field, so it takes the default too
+            value = record.get(column)
+            if value is None:
+                value = default
+            values[column] = None if value is None else self.coerce_append_value(column, value)
+        
+        missing = [column for column in APPEND_REQUIRED[table] if values[column] is None]
+        if from_feed and table == "order_items" and values["order_item_id"] is None:
+            # Feed lines can be replayed, so every record needs a key that makes it idempotent
+            missing.append("order_item_id")
+        if missing:
+            raise ValueError(f"Missing {table} fields: {', '.join(missing)}")
+        if table == "order_items" and values["total_price"] is None:
+            values["total_price"] = round(values["quantity"] * values["unit_price"], 2)
+        return tuple(values.values())
+
+    def coerce_append_value(self, column: str, value: Any) -> Any:
+        """Convert one appended value to its column type, raising ValueError if it does not fit"""
+        if isinstance(value, (bool, dict, list)):
+            raise ValueError(f"Invalid value for {column}: {value!r}")
+        
+        if column in APPEND_TIMESTAMPS:
+            timestamp = datetime.now() if value == "now" else datetime.fromisoformat(str(value))
+            return timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        
+        expected = APPEND_NUMERIC_TYPES.get(column)
+        if expected is None:
+            return str(value)
+        if expected is int and isinstance(value, int):
+            return self.check_int_range(column, value)
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{column} must be a number, got {value!r}")
+        if not math.isfinite(number):
+            raise ValueError(f"{column} must be finite, got {value!r}")
+        if expected is int:
+            if not number.is_integer():
+                raise ValueError(f"{column} must be a whole number, got {value!r}")
+            return self.check_int_range(column, int(number))
+        return number
+
+    def check_int_range(self, column: str, value: int) -> int:
+        """Reject integers SQLite cannot store"""
+        low, high = SQLITE_INT_RANGE
+        if not low <= value <= high:
+            raise ValueError(f"{column} is out of range: {value!r}")
+        return value
+
+    def check_item_references(self, conn: sqlite3.Connection, items: List[tuple], rejected: List[Dict[str, Any]]) -> List[tuple]:
+        """Reject order items whose order or product does not exist, returning the rest"""
+        if not items:
+            return items
+        
+        known = {}
+        for table, key, position in (("orders", "order_id", 1), ("products", "product_id", 2)):
+            ids = list({row[position] for _, row in items})
+            known[table] = {row[0] for row in conn.execute(
+                f"SELECT {key} FROM {table} WHERE {key} IN ({', '.join('?' * len(ids))})", ids
+            )}
+        
+        valid = []
+        for index, row in items:
+            if row[1] not in known["orders"]:
+                rejected.append({"table": "order_items", "index": index, "error": f"Unknown order: {row[1]}"})
+            elif row[2] not in known["products"]:
+                rejected.append({"table": "order_items", "index": index, "error": f"Unknown product: {row[2]}"})
+            else:
+                valid.append((index, row))
+        return valid
+
+    def read_change_feed(self, feed_path: str, offset: int) -> tuple:
+        """Read complete JSON lines appended to the feed since offset"""
+        batch = {table: [] for table in FEED_RECORD_TYPES.values()}
+        path = Path(feed_path)
+        if not path.exists():
+            return batch, offset
+        if path.stat().st_size < offset:
+            logger.warning(f"Change feed {feed_path} was truncated, reading from the start")
+            offset = 0
+        
+        with open(path, 'rb') as feed:
+            feed.seek(offset)
+            chunk = feed.read(FEED_MAX_BATCH_BYTES)
+            end = chunk.rfind(b"\n")
+            if end < 0 and len(chunk) == FEED_MAX_BATCH_BYTES:
+                # A line longer than a whole batch can never be applied, so skip it
+                return batch, self.skip_feed_line(feed, feed_path, offset)
+        if end < 0:
+            # Only an incomplete last line is left; wait for the writer to finish it
+            return batch, offset
+        
+        for line in chunk[:end + 1].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                table = FEED_RECORD_TYPES[record.pop("type")]
+            except (ValueError, KeyError, AttributeError, TypeError) as e:
+                logger.warning(f"Skipping malformed feed record: {line[:200]!r} ({e})")
+                continue
+            batch[table].append(record)
+        return batch, offset + end + 1
+
+    def skip_feed_line(self, feed, feed_path: str, offset: int) -> int:
+        """Return the offset just past the overlong line starting at offset, or offset if it is unfinished"""
+        while True:
+            chunk = feed.read(FEED_MAX_BATCH_BYTES)
+            if not chunk:
+                return offset
+            end = chunk.find(b"\n")
+            if end >= 0:
+                line_end = feed.tell() - len(chunk) + end + 1
+                logger.warning(
+                    f"Skipping feed line at byte {offset} of {feed_path}: "
+                    f"{line_end - offset} bytes is over the {FEED_MAX_BATCH_BYTES} byte batch limit"
+                )
+                return line_end
+
+    def acquire_feed_lock(self) -> bool:
+        """Take the per-database lock that allows a single process to tail change feeds"""
+        if self.feed_lock is not None:
+            return True
+        if fcntl is None:
+            logger.warning("File locking is unavailable; make sure only one process tails the change feed")
+            return True
+        
+        lock_file = open(f"{Path(self.db_path).resolve()}.feed.lock", "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        # Held until the process exits
+        self.feed_lock = lock_file
+        return True
+
+    def read_feed_offset(self, feed_key: str) -> int:
+        """Return the offset saved with the last batch applied from a feed"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute("SELECT value FROM ingest_state WHERE key = ?", (feed_key,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+    async def tail_change_feed(self, feed_path: str, snapshot_path: Optional[str] = None) -> bool:
+        """Apply records appended to the feed file in micro-batches, optionally republishing the snapshot
+
+        Returns False straight away if another process already tails feeds
+        into this database; otherwise runs until cancelled. The lock is taken
+        before loading, so a losing process never touches the database.
+        """
+        if not self.acquire_feed_lock():
+            logger.warning(f"Another process is already tailing change feeds into {self.db_path}; not tailing {feed_path}")
+            return False
+        if not self.data_loaded:
+            await self.load_data()
+        
+        feed_key = f"feed_offset:{Path(feed_path).resolve()}"
+        offset = self.read_feed_offset(feed_key)
+        logger.info(f"Tailing change feed {feed_path} from byte {offset}")
+        last_published = 0.0
+        publish_pending = False
+        while True:
+            await asyncio.sleep(FEED_BATCH_INTERVAL_SECONDS)
+            try:
+                batch, new_offset = self.read_change_feed(feed_path, offset)
+                if new_offset != offset:
+                    result = await self.apply_change_batch(
+                        batch["customers"], batch["orders"], batch["order_items"], (feed_key, new_offset)
+                    )
+                    for rejection in result["rejected"]:
+                        record = batch[rejection["table"]][rejection["index"]]
+                        logger.warning(f"Rejected feed {rejection['table']} record {record!r}: {rejection['error']}")
+                    logger.info(f"Applied change batch: {result['appended']}")
+                    publish_pending = publish_pending or any(result["appended"].values())
+                offset = new_offset
+            except Exception:
+                # Keep tailing; the same lines are retried on the next tick
+                logger.exception(f"Failed to apply change feed batch from {feed_path}")
+                continue
+            
+            if snapshot_path and publish_pending and time.monotonic() - last_published >= SNAPSHOT_PUBLISH_INTERVAL_SECONDS:
+                self.export_snapshot(snapshot_path)
+                last_published = time.monotonic()
+                publish_pending = False
+
     def build_date_filter(self, date_range: str) -> str:
         """Build SQL date filter based on date range"""
-        if date_range == "all":
-            return ""
-        elif date_range == "last_30_days":
-            return "AND order_date >= date('now', '-30 days')"
-        elif date_range == "this_month":
-            return "AND strftime('%Y-%m', order_date) = strftime('%Y-%m', 'now')"
-        elif date_range == "this_year":
-            return "AND strftime('%Y', order_date) = strftime('%Y', 'now')"
-        else:
-            return ""
+        return DATE_FILTERS.get(date_range, "")
 
     def generate_sales_insights(self, metrics: pd.Series) -> List[str]:
         """Generate insights from sales metrics"""
         insights = []
         
+        if pd.isna(metrics['avg_order_value']):
+            return insights
+        
         avg_order = metrics['avg_order_value']
         if avg_order > 100:
             insights.append(f"Strong average order value of ${avg_order:.2f} indicates healthy customer spending")
@@ -691,14 +1657,21 @@ class EcommerceMCPServer:
             top_category = results.iloc[0]
             insights.append(f"'{top_category['category']}' is the leading category with ${top_category['total_revenue']:,.2f} in sales")
             
-        elif analysis_type == "inventory_status":
-            out_of_stock = len(results[results['stock_status'] == 'Out of Stock'])
-            low_stock = len(results[results['stock_status'] == 'Low Stock'])
+        elif analysis_type == "inventory_status" and not results.empty:
+            status_counts = results['stock_status'].value_counts()
+            out_of_stock = int(status_counts.get('Out of Stock', 0))
+            low_stock = int(status_counts.get('Low Stock', 0))
             if out_of_stock > 0:
                 insights.append(f"{out_of_stock} products are out of stock - immediate restocking needed")
             if low_stock > 0:
                 insights.append(f"{low_stock} products have low inventory - consider restocking soon")
         
+        elif analysis_type == "profit_analysis" and not results.empty:
+            loss_makers = int((results['total_profit'] < 0).sum())
+            if loss_makers > 0:
+                insights.append(f"{loss_makers} products are selling at a loss - review pricing or costs")
+        
+        insights.extend(self.generate_rule_insights(analysis_type, results))
         return insights
 
     def generate_customer_insights(self, insight_type: str, results: pd.DataFrame) -> List[str]:
@@ -709,12 +1682,18 @@ class EcommerceMCPServer:
             top_customer_spend = results.iloc[0]['total_spent']
             insights.append(f"Top customer has spent ${top_customer_spend:,.2f} - consider VIP treatment")
             
+        elif insight_type == "geographic_distribution" and not results.empty:
+            top_state = results.iloc[0]
+            insights.append(f"{top_state['shipping_state']} is the largest market with ${top_state['total_revenue']:,.2f} in revenue")
+            
         elif insight_type == "customer_lifetime_value" and not results.empty:
-            premium_clv = results[results['customer_segment'] == 'Premium']['avg_lifetime_value'].iloc[0] if len(results[results['customer_segment'] == 'Premium']) > 0 else 0
-            regular_clv = results[results['customer_segment'] == 'Regular']['avg_lifetime_value'].iloc[0] if len(results[results['customer_segment'] == 'Regular']) > 0 else 0
-            if premium_clv > regular_clv * 2:
+            clv_by_segment = results.set_index('customer_segment')['avg_lifetime_value']
+            premium_clv = clv_by_segment.get('Premium', 0)
+            regular_clv = clv_by_segment.get('Regular', 0)
+            if regular_clv > 0 and premium_clv > regular_clv * 2:
                 insights.append(f"Premium customers have {premium_clv/regular_clv:.1f}x higher lifetime value - focus on premium acquisition")
         
+        insights.extend(self.generate_rule_insights(insight_type, results))
         return insights
 
     def generate_trend_insights(self, trend_type: str, results: pd.DataFrame) -> List[str]:
@@ -722,23 +1701,200 @@ class EcommerceMCPServer:
         insights = []
         
         if trend_type == "growth_rate" and not results.empty:
-            recent_growth = results.iloc[-1]['growth_rate_percent'] if results.iloc[-1]['growth_rate_percent'] is not None else 0
+            recent_growth = results.iloc[-1]['growth_rate_percent']
+            recent_growth = recent_growth if pd.notna(recent_growth) else 0
             if recent_growth > 10:
                 insights.append(f"Strong growth of {recent_growth}% in the latest period")
             elif recent_growth < -10:
                 insights.append(f"Concerning decline of {abs(recent_growth)}% in the latest period - investigation needed")
                 
-        elif trend_type == "daily_patterns" and not results.empty:
-            best_day = results.loc[results['revenue'].idxmax(), 'day_of_week']
-            worst_day = results.loc[results['revenue'].idxmin(), 'day_of_week']
-            insights.append(f"{best_day} is the strongest sales day, while {worst_day} is the weakest")
+        elif trend_type in ("daily_patterns", "seasonal_analysis") and not results.empty:
+            label = 'day_of_week' if trend_type == "daily_patterns" else 'season'
+            revenue = results['revenue'].to_numpy()
+            best = results[label].iloc[revenue.argmax()]
+            worst = results[label].iloc[revenue.argmin()]
+            period_name = "day" if trend_type == "daily_patterns" else "season"
+            insights.append(f"{best} is the strongest sales {period_name}, while {worst} is the weakest")
         
+        elif trend_type == "monthly_trends" and not results.empty:
+            peak = results.iloc[results['revenue'].to_numpy().argmax()]
+            insights.append(f"Peak month was {peak['month']} with ${peak['revenue']:,.2f} in revenue")
+        
+        insights.extend(self.generate_rule_insights(trend_type, results))
         return insights
 
+    def generate_rule_insights(self, analysis_type: str, results: pd.DataFrame) -> List[str]:
+        """Apply the anomaly, outlier, concentration and trend-break rules to a result frame"""
+        rule = INSIGHT_RULES.get(analysis_type)
+        if rule is None or results.empty or rule['metric'] not in results.columns or rule['label'] not in results.columns:
+            return []
+        
+        deadline = time.perf_counter() + INSIGHT_TIME_BUDGET_SECONDS
+        labels, values = self.read_insight_columns(results, rule, deadline)
+        stats = self.compute_insight_stats(values, rule['ordered'])
+        if stats is None:
+            return []
+        
+        metric = rule['metric'].replace('_', ' ')
+        entity = rule['entity']
+        insights = []
+        if len(values) < len(results):
+            insights.append(f"Insights below cover the first {len(values):,} of {len(results):,} rows")
+        for check in (self.concentration_insight, self.outlier_insight, self.anomaly_insight, self.trend_break_insight):
+            if time.perf_counter() > deadline:
+                logger.debug(f"Insight budget exhausted for {analysis_type}")
+                break
+            message = check(stats, labels, metric, entity)
+            if message:
+                insights.append(message)
+        
+        return insights
+
+    def read_insight_columns(self, results: pd.DataFrame, rule: Dict[str, Any], deadline: float) -> tuple:
+        """Convert the label and metric columns chunk by chunk, stopping at the row cap or the deadline"""
+        label_chunks = []
+        value_chunks = []
+        for start in range(0, min(len(results), INSIGHT_MAX_ROWS), INSIGHT_CHUNK_ROWS):
+            if value_chunks and time.perf_counter() > deadline:
+                logger.debug(f"Insight budget exhausted after {start} rows")
+                break
+            chunk = results.iloc[start:start + INSIGHT_CHUNK_ROWS]
+            label_chunks.append(chunk[rule['label']].astype(str).to_numpy())
+            value_chunks.append(pd.to_numeric(chunk[rule['metric']], errors='coerce').to_numpy(dtype=float))
+        return np.concatenate(label_chunks), np.concatenate(value_chunks)
+
+    def compute_insight_stats(self, values: np.ndarray, ordered: bool) -> Optional[Dict[str, Any]]:
+        """Compute every statistic the insight rules need in a single vectorized pass"""
+        valid = ~np.isnan(values)
+        count = int(valid.sum())
+        if count < INSIGHT_MIN_ROWS:
+            return None
+        
+        filled = np.where(valid, values, 0.0)
+        total = filled.sum()
+        q1, median, q3 = np.percentile(values[valid], [25, 50, 75])
+        iqr = q3 - q1
+        mad = np.median(np.abs(values[valid] - median))
+        
+        z_scores = np.where(valid, 0.6745 * (values - median) / mad, 0.0) if mad > 0 else np.zeros_like(filled)
+        outliers = valid & ((values < q1 - OUTLIER_IQR_MULTIPLIER * iqr) | (values > q3 + OUTLIER_IQR_MULTIPLIER * iqr))
+        top_k = min(INSIGHT_TOP_K, count - 1)
+        top_share = None
+        if top_k > 0 and total > 0 and not (values[valid] < 0).any():
+            # Shares of a total only make sense when no entry subtracts from it
+            top_share = float(np.partition(filled / total, -top_k)[-top_k:].sum())
+        
+        changes = None
+        if ordered:
+            previous = values[:-1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                changes = np.where(previous != 0, (values[1:] - previous) / np.abs(previous) * 100, np.nan)
+        
+        return {
+            "count": count,
+            "z_scores": z_scores,
+            "outliers": outliers,
+            "top_k": top_k,
+            "top_share": top_share,
+            "changes": changes,
+        }
+
+    def concentration_insight(self, stats: Dict[str, Any], labels: np.ndarray, metric: str, entity: str) -> Optional[str]:
+        """Flag results where a handful of entries hold well over their fair share of the metric"""
+        if stats['top_share'] is None:
+            return None
+        fair_share = stats['top_k'] / stats['count']
+        if stats['top_share'] >= max(CONCENTRATION_SHARE_THRESHOLD, 2 * fair_share):
+            return f"Top {stats['top_k']} of {stats['count']} {entity} account for {stats['top_share']:.1%} of {metric} - results are highly concentrated"
+        return None
+
+    def outlier_insight(self, stats: Dict[str, Any], labels: np.ndarray, metric: str, entity: str) -> Optional[str]:
+        """Flag entries outside the interquartile fences"""
+        outlier_labels = labels[stats['outliers']]
+        if len(outlier_labels) == 0:
+            return None
+        examples = ", ".join(outlier_labels[:INSIGHT_MAX_NAMES])
+        return f"Outliers on {metric}: {examples} ({len(outlier_labels)} of {stats['count']} {entity})"
+
+    def anomaly_insight(self, stats: Dict[str, Any], labels: np.ndarray, metric: str, entity: str) -> Optional[str]:
+        """Flag entries far from the median by modified z-score"""
+        anomalies = np.flatnonzero(np.abs(stats['z_scores']) >= ANOMALY_Z_THRESHOLD)
+        if len(anomalies) == 0:
+            return None
+        examples = ", ".join(labels[anomalies[:INSIGHT_MAX_NAMES]])
+        return f"Anomalous {metric} for {examples} - modified z-score above {ANOMALY_Z_THRESHOLD:g} relative to the median"
+
+    def trend_break_insight(self, stats: Dict[str, Any], labels: np.ndarray, metric: str, entity: str) -> Optional[str]:
+        """Flag period-over-period changes large enough to break the trend"""
+        changes = stats['changes']
+        if changes is None:
+            return None
+        breaks = np.flatnonzero(np.abs(np.nan_to_num(changes)) >= TREND_BREAK_PERCENT)
+        if len(breaks) == 0:
+            return None
+        recent = breaks[-INSIGHT_MAX_NAMES:]
+        details = ", ".join(f"{labels[i + 1]} ({changes[i]:+.1f}%)" for i in recent)
+        return f"{len(breaks)} trend breaks in {metric} (latest: {details})"
+
+MODULE_IMPORT_SECONDS = time.perf_counter() - _MODULE_IMPORT_STARTED
+
+def check_startup_profile() -> int:
+    """Build the server once, print its startup profile and fail on regressions"""
+    server_instance = EcommerceMCPServer()
+    profile = dict(server_instance.startup_profile)
+    total = profile["module_import"] + profile["server_init"]
+    eager_imports = [name for name in LAZY_MODULES if name in sys.modules]
+    
+    print(json.dumps({
+        "profile": {k: round(v, 4) for k, v in profile.items()},
+        "total_seconds": round(total, 4),
+        "budget_seconds": STARTUP_BUDGET_SECONDS,
+        "eager_imports": eager_imports
+    }, indent=2))
+    
+    if eager_imports:
+        logger.error(f"Heavy modules imported at startup: {', '.join(eager_imports)}")
+        return 1
+    if total > STARTUP_BUDGET_SECONDS:
+        logger.error(f"Startup took {total:.3f}s, over the {STARTUP_BUDGET_SECONDS}s budget")
+        return 1
+    return 0
+
+async def export_snapshot(snapshot_path: str):
+    """Load the data and publish it as a read-only snapshot for worker processes"""
+    server_instance = EcommerceMCPServer()
+    server_instance.snapshot_path = None
+    await server_instance.load_data()
+    server_instance.export_snapshot(snapshot_path)
+
+def log_task_failure(task: asyncio.Task):
+    """Log the exception that stopped a background task, which asyncio would otherwise drop"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task stopped: {task.exception()!r}")
+
+async def ingest_feed(feed_path: str):
+    """Run as the ingestion process: apply the change feed and publish snapshots"""
+    server_instance = EcommerceMCPServer()
+    server_instance.snapshot_path = None
+    # Take the lock before loading or publishing anything
+    if not server_instance.acquire_feed_lock():
+        logger.error(f"Another process is already tailing change feeds into {server_instance.db_path}")
+        sys.exit(1)
+    await server_instance.load_data()
+    if SNAPSHOT_PATH:
+        server_instance.export_snapshot(SNAPSHOT_PATH)
+    if not await server_instance.tail_change_feed(feed_path, SNAPSHOT_PATH):
+        sys.exit(1)
+
 async def main():
     """Main function to run the MCP server"""
     server_instance = EcommerceMCPServer()
     
+    # Apply live orders in-process unless this worker serves a read-only snapshot
+    if FEED_PATH and not server_instance.snapshot_path:
+        feed_task = asyncio.create_task(server_instance.tail_change_feed(FEED_PATH))
+        feed_task.add_done_callback(log_task_failure)
+    
     # Initialize the server
     options = InitializationOptions(
         server_name="ecommerce-analytics",
@@ -753,4 +1909,32 @@ async def main():
         )
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="E-commerce Sales Data Analytics MCP Server")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print the startup profile and exit non-zero if startup regresses"
+    )
+    parser.add_argument(
+        "--export-snapshot",
+        nargs="?",
+        const=SNAPSHOT_PATH or DEFAULT_SNAPSHOT_PATH,
+        metavar="PATH",
+        help="Load the data, write a read-only snapshot for workers and exit"
+    )
+    parser.add_argument(
+        "--ingest-feed",
+        metavar="PATH",
+        help="Apply a JSON-lines change feed continuously, republishing SNAPSHOT_PATH if set"
+    )
+    args = parser.parse_args()
+    
+    if args.profile_startup:
+        sys.exit(check_startup_profile())
+    if args.export_snapshot:
+        asyncio.run(export_snapshot(args.export_snapshot))
+        sys.exit(0)
+    if args.ingest_feed:
+        asyncio.run(ingest_feed(args.ingest_feed))
+        sys.exit(0)
+    asyncio.run(main())
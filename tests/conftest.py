@@ -0,0 +1,74 @@
+"""
+Shared fixtures for the MCP server tests
+"""
+
+import asyncio
+import importlib.util
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+SERVER_DIR = Path(__file__).resolve().parent.parent / "server"
+
+# Minimal stand-in for the mcp package, used only when it is not installed
+MCP_STUB = {
+    "mcp/__init__.py": "",
+    "mcp/server/__init__.py": textwrap.dedent("""
+        class Server:
+            def __init__(self, name):
+                self.name = name
+
+            def list_tools(self):
+                return lambda handler: handler
+
+            def call_tool(self):
+                return lambda handler: handler
+    """),
+    "mcp/server/models.py": textwrap.dedent("""
+        class InitializationOptions:
+            def __init__(self, **kwargs):
+                self.__dict__.update(kwargs)
+    """),
+    "mcp/server/stdio.py": "stdio_server = None\n",
+    "mcp/types.py": "Resource = Tool = TextContent = ImageContent = EmbeddedResource = object\n",
+}
+
+
+@pytest.fixture(scope="session")
+def server_python_path(tmp_path_factory):
+    """sys.path entries needed to import server/main.py, with the mcp stub if required"""
+    python_path = [str(SERVER_DIR)]
+    if importlib.util.find_spec("mcp") is None:
+        stub_dir = tmp_path_factory.mktemp("stubs")
+        for relative_path, source in MCP_STUB.items():
+            target = stub_dir / relative_path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(source)
+        python_path.append(str(stub_dir))
+    return python_path
+
+
+@pytest.fixture(scope="session")
+def main_module(server_python_path):
+    """Import server/main.py into the test process"""
+    sys.path[:0] = server_python_path
+    import main
+    return main
+
+
+@pytest.fixture
+def server(main_module):
+    """A server instance with no data loaded"""
+    return main_module.EcommerceMCPServer()
+
+
+@pytest.fixture
+def loaded_server(server, tmp_path):
+    """A server with sample data loaded into a database under tmp_path"""
+    server.db_path = str(tmp_path / "ecommerce_data.db")
+    asyncio.run(server.load_data())
+    yield server
+    if server.feed_lock is not None:
+        server.feed_lock.close()
@@ -0,0 +1,14 @@
+"""
+Tests for the analysis tools
+"""
+
+import asyncio
+
+
+def test_ranked_limits_are_reported(loaded_server):
+    capped = asyncio.run(loaded_server.analyze_products("top_products", 500))
+    uncapped = asyncio.run(loaded_server.analyze_products("inventory_status", 150))
+
+    assert capped["limit"] == 100 and len(capped["results"]) == 100
+    assert uncapped["limit"] == 150 and len(uncapped["results"]) == 150
+    assert "error" in asyncio.run(loaded_server.analyze_customers("top_customers", 0))
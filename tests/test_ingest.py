@@ -0,0 +1,214 @@
+"""
+Tests for incremental rollup maintenance and the change feed
+"""
+
+import asyncio
+import contextlib
+import json
+import sqlite3
+import time
+
+import pandas as pd
+import pytest
+
+ROLLUP_KEYS = {
+    "product_sales": ["product_id"],
+    "customer_sales": ["customer_id"],
+    "state_status_sales": ["shipping_state", "status"],
+}
+
+
+def read_rollups(conn):
+    """Read every rollup table, sorted by its key"""
+    return {
+        table: pd.read_sql_query(f"SELECT * FROM {table}", conn).sort_values(keys).reset_index(drop=True)
+        for table, keys in ROLLUP_KEYS.items()
+    }
+
+
+def rebuilt_rollups(main_module, db_path):
+    """Rebuild the rollups from scratch in a copy of the database"""
+    source = sqlite3.connect(db_path)
+    copy = sqlite3.connect(":memory:")
+    source.backup(copy)
+    source.close()
+    copy.executescript(main_module.ROLLUP_SQL)
+    rollups = read_rollups(copy)
+    copy.close()
+    return rollups
+
+
+def assert_rollups_match_rebuild(main_module, db_path):
+    conn = sqlite3.connect(db_path)
+    maintained = read_rollups(conn)
+    conn.close()
+    for table, expected in rebuilt_rollups(main_module, db_path).items():
+        pd.testing.assert_frame_equal(maintained[table], expected, check_dtype=False, rtol=1e-9, obj=table)
+
+
+def table_counts(db_path):
+    conn = sqlite3.connect(db_path)
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ("orders", "order_items")}
+    conn.close()
+    return counts
+
+
+def completed_order(db_path):
+    conn = sqlite3.connect(db_path)
+    order_id = conn.execute("SELECT order_id FROM orders WHERE status = 'completed' LIMIT 1").fetchone()[0]
+    conn.close()
+    return order_id
+
+
+def test_mixed_batch_matches_full_rebuild(main_module, loaded_server):
+    existing_order = completed_order(loaded_server.db_path)
+    result = asyncio.run(loaded_server.apply_change_batch(
+        [{"customer_id": "CUST-9001", "customer_segment": "Premium"}],
+        [
+            {"order_id": "ORD-900001", "customer_id": "CUST-9001", "total_amount": 120.5, "shipping_state": "CA"},
+            {"order_id": "ORD-900002", "customer_id": "CUST-0003", "total_amount": 42.0, "status": "pending", "shipping_state": "NY"},
+            {"order_id": existing_order, "customer_id": "CUST-0003", "total_amount": 10.0},
+        ],
+        [
+            {"order_id": "ORD-900001", "product_id": "PROD-0002", "quantity": 2, "unit_price": 60.25},
+            {"order_id": existing_order, "product_id": "PROD-0005", "quantity": 1, "unit_price": 19.99},
+            {"order_id": "ORD-900002", "product_id": "PROD-0007", "quantity": 3, "unit_price": 14.0},
+            {"order_id": "ORD-MISSING", "product_id": "PROD-0002", "quantity": 1, "unit_price": 5.0},
+        ],
+    ))
+
+    assert result["appended"] == {"customers": 1, "orders": 2, "order_items": 3}
+    assert {(r["table"], r["index"]) for r in result["rejected"]} == {("orders", 2), ("order_items", 3)}
+    assert_rollups_match_rebuild(main_module, loaded_server.db_path)
+
+
+def test_orders_without_state_share_one_rollup_row(main_module, loaded_server):
+    for order_id in ("ORD-900020", "ORD-900021"):
+        asyncio.run(loaded_server.apply_change_batch(
+            [], [{"order_id": order_id, "customer_id": "CUST-0001", "total_amount": 25.0}], []
+        ))
+
+    conn = sqlite3.connect(loaded_server.db_path)
+    rows = conn.execute(
+        "SELECT shipping_state, orders FROM state_status_sales WHERE shipping_state IS NULL OR shipping_state = 'Unknown'"
+    ).fetchall()
+    conn.close()
+    assert rows == [("Unknown", 2)]
+    assert_rollups_match_rebuild(main_module, loaded_server.db_path)
+
+
+def test_invalid_records_are_rejected_individually(loaded_server):
+    result = asyncio.run(loaded_server.apply_change_batch(
+        [],
+        [
+            {"order_id": "ORD-900010", "customer_id": "CUST-0001", "total_amount": "abc"},
+            {"order_id": "ORD-900011", "customer_id": "CUST-0001", "total_amount": 15.0},
+            ["not", "a", "record"],
+        ],
+        [
+            {"order_item_id": 2 ** 70, "order_id": "ORD-900011", "product_id": "PROD-0002", "quantity": 1, "unit_price": 1.0},
+            {"order_id": "ORD-900011", "product_id": "PROD-0002", "quantity": 1.5, "unit_price": 1.0},
+            {"order_id": "ORD-900011", "product_id": "PROD-0002", "quantity": "2", "unit_price": "7.5"},
+        ],
+    ))
+
+    assert result["appended"] == {"customers": 0, "orders": 1, "order_items": 1}
+    assert {(r["table"], r["index"]) for r in result["rejected"]} == {
+        ("orders", 0), ("orders", 2), ("order_items", 0), ("order_items", 1)
+    }
+
+
+def write_feed(path, records):
+    with open(path, "a") as feed:
+        for record in records:
+            feed.write((record if isinstance(record, str) else json.dumps(record)) + "\n")
+
+
+async def tail_until_caught_up(server, feed_path, timeout=10.0):
+    """Run the tailer until the saved offset reaches the end of the feed"""
+    task = asyncio.create_task(server.tail_change_feed(str(feed_path)))
+    feed_key = f"feed_offset:{feed_path.resolve()}"
+    deadline = time.monotonic() + timeout
+    try:
+        while server.read_feed_offset(feed_key) < feed_path.stat().st_size:
+            assert not task.done(), "tailer stopped"
+            assert time.monotonic() < deadline, "tailer did not catch up"
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+def restart(main_module, server):
+    """Release the feed lock and return a fresh server on the same database"""
+    server.feed_lock.close()
+    server.feed_lock = None
+    restarted = main_module.EcommerceMCPServer()
+    restarted.db_path = server.db_path
+    return restarted
+
+
+def test_feed_resumes_and_replays_idempotently(main_module, loaded_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(main_module, "FEED_BATCH_INTERVAL_SECONDS", 0.01)
+    feed_path = tmp_path / "feed.jsonl"
+    write_feed(feed_path, [
+        {"type": "order", "order_id": "ORD-900100", "customer_id": "CUST-0004", "total_amount": 80.0, "shipping_state": "TX"},
+        {"type": "order_item", "order_item_id": 900100, "order_id": "ORD-900100", "product_id": "PROD-0002", "quantity": 2, "unit_price": 40.0},
+        "[1, 2]",
+        {"type": "order_item", "order_id": "ORD-900100", "product_id": "PROD-0003", "quantity": 1, "unit_price": 5.0},
+    ])
+    asyncio.run(tail_until_caught_up(loaded_server, feed_path))
+    applied = table_counts(loaded_server.db_path)
+
+    # A restart resumes after the last applied line
+    server = restart(main_module, loaded_server)
+    write_feed(feed_path, [
+        {"type": "order_item", "order_item_id": 900101, "order_id": "ORD-900100", "product_id": "PROD-0003", "quantity": 1, "unit_price": 5.0},
+    ])
+    asyncio.run(tail_until_caught_up(server, feed_path))
+    assert table_counts(server.db_path) == {"orders": applied["orders"], "order_items": applied["order_items"] + 1}
+    assert_rollups_match_rebuild(main_module, server.db_path)
+
+    # Replaying the whole feed counts nothing twice
+    resumed = table_counts(server.db_path)
+    conn = sqlite3.connect(server.db_path)
+    conn.execute("UPDATE ingest_state SET value = 0 WHERE key LIKE 'feed_offset:%'")
+    conn.commit()
+    conn.close()
+    server = restart(main_module, server)
+    asyncio.run(tail_until_caught_up(server, feed_path))
+    assert table_counts(server.db_path) == resumed
+    assert_rollups_match_rebuild(main_module, server.db_path)
+    server.feed_lock.close()
+
+
+def test_second_tailer_backs_off(main_module, loaded_server, tmp_path):
+    assert loaded_server.acquire_feed_lock()
+    other = main_module.EcommerceMCPServer()
+    other.db_path = loaded_server.db_path
+    assert asyncio.run(other.tail_change_feed(str(tmp_path / "feed.jsonl"))) is False
+    assert not other.data_loaded
+
+
+def test_second_ingest_process_exits_before_publishing(main_module, loaded_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main_module, "SNAPSHOT_PATH", str(tmp_path / "snapshot.db"))
+    assert loaded_server.acquire_feed_lock()
+
+    with pytest.raises(SystemExit):
+        asyncio.run(main_module.ingest_feed(str(tmp_path / "feed.jsonl")))
+    assert not (tmp_path / "snapshot.db").exists()
+
+
+def test_query_cache_is_bounded(main_module, loaded_server, monkeypatch):
+    monkeypatch.setattr(main_module, "QUERY_CACHE_MAX_ENTRIES", 3)
+    conn = loaded_server.connect()
+    for limit in range(1, 6):
+        loaded_server.run_query(conn, "inventory_status", limit=limit)
+    loaded_server.run_query(conn, "inventory_status", limit=3)
+    loaded_server.run_query(conn, "inventory_status", limit=6)
+    conn.close()
+
+    assert [key[1] for key in loaded_server.query_cache] == [5, 3, 6]
+
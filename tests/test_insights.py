@@ -0,0 +1,79 @@
+"""
+Tests for the rule-based insight engine
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def test_concentration_skipped_when_values_are_negative(server):
+    results = pd.DataFrame({
+        "product_name": [f"Product {i}" for i in range(6)],
+        "total_profit": [100.0, 90.0, 80.0, -150.0, -60.0, -40.0],
+    })
+
+    insights = server.generate_rule_insights("profit_analysis", results)
+
+    assert not any("account for" in insight for insight in insights)
+
+
+def test_concentration_reported_for_non_negative_values(server):
+    results = pd.DataFrame({
+        "product_name": [f"Product {i}" for i in range(10)],
+        "total_revenue": [500.0, 400.0, 300.0] + [10.0] * 7,
+    })
+
+    insights = server.generate_rule_insights("top_products", results)
+
+    assert "Top 3 of 10 products account for 94.5% of total revenue - results are highly concentrated" in insights
+
+
+def ranked_products(values):
+    return pd.DataFrame({
+        "product_name": [f"Product {i}" for i in range(len(values))],
+        "total_revenue": values,
+    })
+
+
+def test_too_few_rows_yield_no_insights(main_module, server):
+    rows = main_module.INSIGHT_MIN_ROWS
+    assert server.generate_rule_insights("top_products", ranked_products([100.0] + [1.0] * (rows - 2))) == []
+    # Missing values do not count towards the minimum
+    assert server.generate_rule_insights("top_products", ranked_products([100.0, None] + [1.0] * (rows - 2))) == []
+    assert server.generate_rule_insights("top_products", ranked_products([100.0] + [1.0] * (rows - 1))) != []
+
+
+def test_zero_mad_disables_anomalies(server):
+    stats = server.compute_insight_stats(np.array([10.0, 10.0, 10.0, 10.0, 50.0]), ordered=False)
+
+    assert not stats["z_scores"].any()
+    insights = server.generate_rule_insights("top_products", ranked_products([10.0, 10.0, 10.0, 10.0, 50.0]))
+    assert not any(insight.startswith("Anomalous") for insight in insights)
+    assert "Outliers on total revenue: Product 4 (1 of 5 products)" in insights
+
+
+def test_outlier_and_anomaly_fire_on_short_results(server):
+    insights = server.generate_rule_insights("top_products", ranked_products([100.0, 14.0, 13.0, 12.0, 11.0, 10.0]))
+
+    assert "Outliers on total revenue: Product 0 (1 of 6 products)" in insights
+    assert "Anomalous total revenue for Product 0 - modified z-score above 3.5 relative to the median" in insights
+
+
+def test_trend_break_is_labelled_with_the_later_period(server):
+    results = pd.DataFrame({
+        "month": ["2024-01", "2024-02", "2024-03", "2024-04"],
+        "revenue": [100.0, 105.0, 150.0, 148.0],
+    })
+
+    insights = server.generate_rule_insights("monthly_trends", results)
+
+    assert "1 trend breaks in revenue (latest: 2024-03 (+42.9%))" in insights
+
+
+def test_truncated_results_are_noted(main_module, server, monkeypatch):
+    monkeypatch.setattr(main_module, "INSIGHT_MAX_ROWS", 8)
+    monkeypatch.setattr(main_module, "INSIGHT_CHUNK_ROWS", 4)
+
+    insights = server.generate_rule_insights("top_products", ranked_products([float(i) for i in range(12)]))
+
+    assert insights[0] == "Insights below cover the first 8 of 12 rows"
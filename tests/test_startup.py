@@ -0,0 +1,59 @@
+"""
+Startup regression tests for the MCP server
+Each check runs in a fresh interpreter so imports from other tests don't leak in
+"""
+
+import json
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+STARTUP_SCRIPT = textwrap.dedent("""
+    import json
+    import sys
+
+    import main
+
+    server_instance = main.EcommerceMCPServer()
+    eager_imports = [name for name in main.LAZY_MODULES if name in sys.modules]
+    catalog = main.compile_query_catalog()
+    profile = server_instance.startup_profile
+
+    print(json.dumps({
+        "eager_imports": eager_imports,
+        "catalog_size": len(catalog),
+        "catalog_expected": len(main.QUERY_CATALOG),
+        "total_seconds": profile["module_import"] + profile["server_init"],
+        "budget_seconds": main.STARTUP_BUDGET_SECONDS,
+    }))
+""")
+
+
+@pytest.fixture(scope="module")
+def startup_report(tmp_path_factory, server_python_path):
+    """Build the server once in a subprocess and return its startup report"""
+    work_dir = tmp_path_factory.mktemp("startup")
+    bootstrap = f"import sys; sys.path[:0] = {server_python_path!r}\n" + STARTUP_SCRIPT
+    completed = subprocess.run(
+        [sys.executable, "-c", bootstrap],
+        cwd=work_dir,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def test_heavy_modules_are_imported_lazily(startup_report):
+    assert startup_report["eager_imports"] == []
+
+
+def test_query_catalog_compiles(startup_report):
+    assert startup_report["catalog_size"] == startup_report["catalog_expected"]
+
+
+def test_startup_within_budget(startup_report):
+    assert startup_report["total_seconds"] <= startup_report["budget_seconds"]